@@ -0,0 +1,151 @@
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+Matrix2x2 = Tuple[int, int, int, int]
+
+# every value is stored as its byte length followed by its little-endian unsigned bytes
+LENGTH_PREFIX = struct.Struct("<Q")
+# next index to write and output file offset to continue from, followed by F(index) and F(index + 1)
+CHECKPOINT_HEADER = struct.Struct("<QQ")
+
+
+def gen_fibs(n: int) -> List[int]:
+    # """Generate first fibonacci numbers up to n-th inclusive starting from zero"""
+    if n == 0:
+        return [0]
+    if n == 1:
+        return [1]
+    fibs = [0, 1]
+    for _ in range(n - 1):
+        fibs.append(fibs[-1] + fibs[-2])
+    return fibs
+
+
+def fib_pair(n: int) -> Tuple[int, int]:
+    """Returns (F(n), F(n + 1)) by fast doubling: O(log n) big integer multiplications."""
+    if n < 0:
+        raise ValueError(f"fibonacci index must be non-negative, got {n}")
+    current, following = 0, 1
+    for bit in bin(n)[2:]:
+        # F(2k) = F(k) * (2F(k + 1) - F(k)), F(2k + 1) = F(k)^2 + F(k + 1)^2
+        doubled = current * (2 * following - current)
+        doubled_next = current * current + following * following
+        if bit == "1":
+            current, following = doubled_next, doubled + doubled_next
+        else:
+            current, following = doubled, doubled_next
+    return current, following
+
+
+def _matrix_mul(lhs: Matrix2x2, rhs: Matrix2x2) -> Matrix2x2:
+    a, b, c, d = lhs
+    e, f, g, h = rhs
+    return a * e + b * g, a * f + b * h, c * e + d * g, c * f + d * h
+
+
+def fib_matrix_power(n: int) -> int:
+    """Returns F(n) as the corner of [[1, 1], [1, 0]]^n computed by binary exponentiation."""
+    if n < 0:
+        raise ValueError(f"fibonacci index must be non-negative, got {n}")
+    result, power = (1, 0, 0, 1), (1, 1, 1, 0)
+    while n:
+        if n & 1:
+            result = _matrix_mul(result, power)
+        power = _matrix_mul(power, power)
+        n >>= 1
+    return result[1]
+
+
+def fib(n: int) -> int:
+    return fib_pair(n)[0]
+
+
+def iter_fibs(start: int = 0, stop: Optional[int] = None) -> Iterator[int]:
+    """Lazily yields F(start), F(start + 1), ... up to F(stop) inclusive, or endlessly if stop is None."""
+    current, following = fib_pair(start)
+    index = start
+    while stop is None or index <= stop:
+        yield current
+        current, following = following, current + following
+        index += 1
+
+
+def fib_range(k: int, m: int) -> List[int]:
+    """Returns [F(k), ..., F(m)] seeded with fast doubling for F(k) and F(k + 1)."""
+    return list(iter_fibs(k, m))
+
+
+def write_int(file: BinaryIO, value: int):
+    data = value.to_bytes((value.bit_length() + 7) // 8, "little")
+    file.write(LENGTH_PREFIX.pack(len(data)))
+    file.write(data)
+
+
+def read_int(file: BinaryIO) -> Optional[int]:
+    """Returns the next stored value or None at the end of file."""
+    prefix = file.read(LENGTH_PREFIX.size)
+    if len(prefix) < LENGTH_PREFIX.size:
+        return None
+    (length,) = LENGTH_PREFIX.unpack(prefix)
+    return int.from_bytes(file.read(length), "little")
+
+
+def write_fibs(file: BinaryIO, values: Iterable[int]) -> int:
+    count = 0
+    for value in values:
+        write_int(file, value)
+        count += 1
+    return count
+
+
+def read_fibs(file: BinaryIO) -> Iterator[int]:
+    value = read_int(file)
+    while value is not None:
+        yield value
+        value = read_int(file)
+
+
+def save_checkpoint(filename: str, index: int, offset: int, current: int, following: int):
+    """Atomically replaces the checkpoint, so an interrupted save leaves the previous one intact."""
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as file:
+        file.write(CHECKPOINT_HEADER.pack(index, offset))
+        write_int(file, current)
+        write_int(file, following)
+    os.replace(tmp_filename, filename)
+
+
+def load_checkpoint(filename: str) -> Tuple[int, int, int, int]:
+    """Returns (index, offset, F(index), F(index + 1)) saved by save_checkpoint."""
+    with open(filename, "rb") as file:
+        index, offset = CHECKPOINT_HEADER.unpack(file.read(CHECKPOINT_HEADER.size))
+        return index, offset, read_int(file), read_int(file)
+
+
+def stream_fibs(n: int, filename: str, checkpoint_filename: Optional[str] = None, checkpoint_every: int = 10_000,
+                resume: bool = False) -> int:
+    """
+    Writes F(0), ..., F(n) to filename keeping only two values in memory at a time,
+    saving a checkpoint every checkpoint_every values if checkpoint_filename is given.
+    With resume, continues from the checkpoint instead of starting over. Returns the number of values written.
+    """
+    index, offset, current, following = 0, 0, 0, 1
+    if resume and checkpoint_filename is not None and os.path.exists(checkpoint_filename):
+        index, offset, current, following = load_checkpoint(checkpoint_filename)
+
+    with open(filename, "r+b" if offset else "wb") as file:
+        file.seek(offset)
+        file.truncate()  # drop values written after the checkpoint
+        start_index = index
+        while index <= n:
+            write_int(file, current)
+            current, following = following, current + following
+            index += 1
+            if checkpoint_filename is not None and (index - start_index) % checkpoint_every == 0:
+                file.flush()
+                save_checkpoint(checkpoint_filename, index, file.tell(), current, following)
+
+    if checkpoint_filename is not None:
+        save_checkpoint(checkpoint_filename, index, os.path.getsize(filename), current, following)
+    return index - start_index
@@ -3,10 +3,15 @@ import os
 from typing import List, NoReturn, Any, Tuple
 import ast
 import _ast
-import astunparse
-import matplotlib.pyplot as plt
-import networkx as nx
-from networkx.drawing.nx_pydot import graphviz_layout
+
+from .fibs import gen_fibs
+from .tree_layout import tidy_tree_layout, write_dot, write_svg
+
+# matplotlib and networkx take hundreds of milliseconds to import,
+# so they are imported on the first drawing and importing gen_fibs doesn't pay for them
+
+# these formats are laid out and written by tree_layout, without matplotlib and Graphviz
+TEXT_WRITERS = {".svg": write_svg, ".dot": write_dot}
 
 
 class AstDrawer(ast.NodeVisitor):
@@ -60,11 +65,11 @@ class AstDrawer(ast.NodeVisitor):
             self.__visit_known_node(label, [("value", node.value)], "darkgray")
 
         def visit_BinOp(self, node: _ast.BinOp) -> Any:
-            label = "BinOp\nop: " + astunparse.dump(node.op)
+            label = "BinOp\nop: " + ast.dump(node.op)
             self.__visit_known_node(label, [("left", node.left), ("right", node.right)], "palegreen")
 
         def visit_UnaryOp(self, node: _ast.UnaryOp) -> Any:
-            label = "UnaryOp\nop: " + astunparse.dump(node.op)
+            label = "UnaryOp\nop: " + ast.dump(node.op)
             self.__visit_known_node(label, [("operand", node.operand)], "palegreen")
 
         def visit_Name(self, node: _ast.Name) -> Any:
@@ -125,9 +130,21 @@ class AstDrawer(ast.NodeVisitor):
             self.__visit_known_node(label, [("value", node.value)], "palegreen")
 
     @staticmethod
-    def draw(code: str) -> NoReturn:
+    def draw(code: str, filename: str = "artifacts/ast.png") -> NoReturn:
         visitor = AstDrawer.AstVisitor()
         visitor.visit(ast.parse(code))
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+
+        writer = TEXT_WRITERS.get(os.path.splitext(filename)[1])
+        if writer is not None:
+            positions = tidy_tree_layout(visitor.nodes, visitor.edges)
+            with open(filename, "w") as file:
+                writer(file, visitor.nodes, visitor.colors, visitor.edges, visitor.edge_labels, positions)
+            return
+
+        import matplotlib.pyplot as plt
+        import networkx as nx
+        from networkx.drawing.nx_pydot import graphviz_layout
 
         labels = {i: visitor.nodes[i] for i in range(len(visitor.nodes))}
         node_colors = visitor.colors
@@ -142,27 +159,12 @@ class AstDrawer(ast.NodeVisitor):
         nx.draw(graph, node_color=node_colors, pos=pos, labels=labels, with_labels=True,
                 font_size=12, node_shape="s", node_size=[len(labels[i]) * 400 for i in pos])
         nx.draw_networkx_edge_labels(graph, pos, edge_labels=edge_labels)
-
-        filename = "artifacts/ast.png"
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
         plt.savefig(filename)
 
 
-def gen_fibs(n: int) -> List[int]:
-    # """Generate first fibonacci numbers up to n-th inclusive starting from zero"""
-    if n == 0:
-        return [0]
-    if n == 1:
-        return [1]
-    fibs = [0, 1]
-    for _ in range(n - 1):
-        fibs.append(fibs[-1] + fibs[-2])
-    return fibs
-
-
-def draw_fibs_ast() -> NoReturn:
+def draw_fibs_ast(filename: str = "artifacts/ast.png") -> NoReturn:
     drawer = AstDrawer()
-    drawer.draw(inspect.getsource(gen_fibs))
+    drawer.draw(inspect.getsource(gen_fibs), filename)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,219 @@
+from typing import Dict, List, NoReturn, Sequence, TextIO, Tuple
+
+Edge = Tuple[int, int]
+Point = Tuple[float, float]
+
+# sizes in SVG user units (pixels)
+CHAR_WIDTH = 7.5
+LINE_HEIGHT = 16
+NODE_PADDING = 12
+SIBLING_GAP = 20
+LEVEL_GAP = 90  # leaves room for edge labels between two-line nodes
+MARGIN = 20
+FONT_SIZE = 12
+
+
+def node_size(label: str) -> Tuple[float, float]:
+    lines = label.split("\n")
+    return max(map(len, lines)) * CHAR_WIDTH + NODE_PADDING, len(lines) * LINE_HEIGHT + NODE_PADDING
+
+
+class TidyTreeLayout:
+    """
+    Reingold-Tilford layout in linear time as improved by Buchheim, Junger and Leipert:
+    parents are centered over their children, subtrees are pushed apart just enough for their contours
+    not to overlap and smaller subtrees between them are spaced out evenly.
+    Contours are followed by threads, moves of subtrees are deferred to shift and change
+    and applied once per parent, so every node is visited a constant number of times.
+    Works over node indices with edges from parents to children in left to right order, node 0 being the root;
+    nodes may differ in width. Walks are iterative, so deep trees don't hit the recursion limit.
+    """
+
+    def __init__(self, widths: Sequence[float], edges: Sequence[Edge]):
+        n = len(widths)
+        self.widths = widths
+        self.parent = [-1] * n
+        self.children: List[List[int]] = [[] for _ in range(n)]
+        self.number = [0] * n  # index among siblings
+        for parent, child in edges:
+            self.parent[child] = parent
+            self.number[child] = len(self.children[parent])
+            self.children[parent].append(child)
+
+        self.prelim = [0.0] * n
+        self.mod = [0.0] * n
+        self.shift = [0.0] * n
+        self.change = [0.0] * n
+        self.thread = [-1] * n
+        self.ancestor = list(range(n))
+        self.default_ancestor = [-1] * n  # of the children of a node, while they are walked
+
+    def _separation(self, left: int, right: int) -> float:
+        return (self.widths[left] + self.widths[right]) / 2 + SIBLING_GAP
+
+    def _left_sibling(self, v: int) -> int:
+        return self.children[self.parent[v]][self.number[v] - 1] if self.number[v] > 0 else -1
+
+    def _next_left(self, v: int) -> int:
+        return self.children[v][0] if self.children[v] else self.thread[v]
+
+    def _next_right(self, v: int) -> int:
+        return self.children[v][-1] if self.children[v] else self.thread[v]
+
+    def _move_subtree(self, left: int, right: int, shift: float) -> NoReturn:
+        subtrees = self.number[right] - self.number[left]
+        self.change[right] -= shift / subtrees
+        self.shift[right] += shift
+        self.change[left] += shift / subtrees
+        self.prelim[right] += shift
+        self.mod[right] += shift
+
+    def _execute_shifts(self, v: int) -> NoReturn:
+        shift = change = 0.0
+        for w in reversed(self.children[v]):
+            self.prelim[w] += shift
+            self.mod[w] += shift
+            change += self.change[w]
+            shift += self.shift[w] + change
+
+    def _apportion(self, v: int, default_ancestor: int) -> int:
+        """Pushes the subtree of v right of its left siblings' subtrees, returns the new default ancestor."""
+        left_sibling = self._left_sibling(v)
+        if left_sibling == -1:
+            return default_ancestor
+        prelim, mod = self.prelim, self.mod
+        # inner and outer contours of the right (p) and the left (m) parts
+        vip = vop = v
+        vim = left_sibling
+        vom = self.children[self.parent[v]][0]
+        sip, sop, sim, som = mod[vip], mod[vop], mod[vim], mod[vom]
+        while self._next_right(vim) != -1 and self._next_left(vip) != -1:
+            vim, vip = self._next_right(vim), self._next_left(vip)
+            vom, vop = self._next_left(vom), self._next_right(vop)
+            self.ancestor[vop] = v
+            shift = (prelim[vim] + sim) - (prelim[vip] + sip) + self._separation(vim, vip)
+            if shift > 0:
+                ancestor = self.ancestor[vim]
+                if self.parent[ancestor] != self.parent[v]:
+                    ancestor = default_ancestor
+                self._move_subtree(ancestor, v, shift)
+                sip += shift
+                sop += shift
+            sim += mod[vim]
+            sip += mod[vip]
+            som += mod[vom]
+            sop += mod[vop]
+        if self._next_right(vim) != -1 and self._next_right(vop) == -1:
+            self.thread[vop] = self._next_right(vim)
+            mod[vop] += sim - sop
+        if self._next_left(vip) != -1 and self._next_left(vom) == -1:
+            self.thread[vom] = self._next_left(vip)
+            mod[vom] += sip - som
+            default_ancestor = v
+        return default_ancestor
+
+    def _post_order(self) -> List[int]:
+        order, stack = [], [0]
+        while stack:
+            v = stack.pop()
+            order.append(v)
+            stack += self.children[v]
+        order.reverse()  # children were pushed left to right, so they come out right to left
+        return order
+
+    def _first_walk(self) -> NoReturn:
+        for v in self._post_order():
+            children = self.children[v]
+            left_sibling = self._left_sibling(v)
+            if children:
+                self._execute_shifts(v)
+                midpoint = (self.prelim[children[0]] + self.prelim[children[-1]]) / 2
+                if left_sibling != -1:
+                    self.prelim[v] = self.prelim[left_sibling] + self._separation(left_sibling, v)
+                    self.mod[v] = self.prelim[v] - midpoint
+                else:
+                    self.prelim[v] = midpoint
+            elif left_sibling != -1:
+                self.prelim[v] = self.prelim[left_sibling] + self._separation(left_sibling, v)
+
+            parent = self.parent[v]
+            if parent != -1:
+                if left_sibling == -1:
+                    self.default_ancestor[parent] = v
+                self.default_ancestor[parent] = self._apportion(v, self.default_ancestor[parent])
+
+    def positions(self) -> List[Point]:
+        """Centers of the nodes, the root at the top and every level LEVEL_GAP below the previous one."""
+        n = len(self.widths)
+        if n == 0:
+            return []
+        self._first_walk()
+
+        xs, depths = [0.0] * n, [0] * n
+        stack = [(0, 0.0)]
+        while stack:
+            v, mod_sum = stack.pop()
+            xs[v] = self.prelim[v] + mod_sum
+            for w in self.children[v]:
+                depths[w] = depths[v] + 1
+                stack.append((w, mod_sum + self.mod[v]))
+
+        left = min(x - width / 2 for x, width in zip(xs, self.widths))
+        return [(x - left + MARGIN, MARGIN + (depth + 0.5) * LEVEL_GAP) for x, depth in zip(xs, depths)]
+
+
+def tidy_tree_layout(labels: Sequence[str], edges: Sequence[Edge]) -> List[Point]:
+    return TidyTreeLayout([node_size(label)[0] for label in labels], edges).positions()
+
+
+def escape_xml(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def escape_dot(text: str) -> str:
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_svg(stream: TextIO, labels: Sequence[str], colors: Sequence[str], edges: Sequence[Edge],
+              edge_labels: Dict[Edge, str], positions: Sequence[Point]) -> NoReturn:
+    """Writes the laid out tree as SVG element by element: edges with their labels first, then nodes over them."""
+    sizes = [node_size(label) for label in labels]
+    width = max((x + size[0] / 2 for (x, _), size in zip(positions, sizes)), default=0) + MARGIN
+    height = max((y + size[1] / 2 for (_, y), size in zip(positions, sizes)), default=0) + MARGIN
+    stream.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+                 f'font-family="monospace" font-size="{FONT_SIZE}" text-anchor="middle">\n')
+
+    stream.write('<g stroke="black">\n')
+    for parent, child in edges:
+        (x1, y1), (x2, y2) = positions[parent], positions[child]
+        stream.write(f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}"/>\n')
+    stream.write('</g>\n<g fill="dimgray">\n')
+    for edge in edges:
+        (x1, y1), (x2, y2) = positions[edge[0]], positions[edge[1]]
+        stream.write(f'<text x="{(x1 + x2) / 2:.1f}" y="{(y1 + y2) / 2:.1f}">{escape_xml(edge_labels[edge])}</text>\n')
+    stream.write('</g>\n')
+
+    for label, color, (x, y), (node_width, node_height) in zip(labels, colors, positions, sizes):
+        lines = label.split("\n")
+        stream.write(f'<rect x="{x - node_width / 2:.1f}" y="{y - node_height / 2:.1f}" width="{node_width:.1f}" '
+                     f'height="{node_height:.1f}" fill="{color}" stroke="black"/>'
+                     f'<text x="{x:.1f}" y="{y - (len(lines) - 1) * LINE_HEIGHT / 2:.1f}" dy="0.35em">')
+        stream.write("".join(f'<tspan x="{x:.1f}" dy="{LINE_HEIGHT if i else 0}">{escape_xml(line)}</tspan>'
+                             for i, line in enumerate(lines)))
+        stream.write('</text>\n')
+    stream.write('</svg>\n')
+
+
+def write_dot(stream: TextIO, labels: Sequence[str], colors: Sequence[str], edges: Sequence[Edge],
+              edge_labels: Dict[Edge, str], positions: Sequence[Point]) -> NoReturn:
+    """
+    Writes the tree as Graphviz DOT with node positions in points, y pointing up as Graphviz expects,
+    so `neato -n` renders the tidy layout as is and `dot` lays it out again.
+    """
+    bottom = max((y for _, y in positions), default=0)
+    stream.write('digraph ast {\nnode [shape=box, style=filled];\n')
+    for index, (label, color, (x, y)) in enumerate(zip(labels, colors, positions)):
+        stream.write(f'{index} [label="{escape_dot(label)}", fillcolor="{color}", pos="{x:.1f},{bottom - y:.1f}"];\n')
+    for edge in edges:
+        stream.write(f'{edge[0]} -> {edge[1]} [label="{escape_dot(edge_labels[edge])}"];\n')
+    stream.write('}\n')
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import operator
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Tuple, Union
+
+import numpy as np
+
+from my_matrix import MyMatrix, AddError, ElementWiseMultiplyError, MathematicalMultiplyError, flat_buffer, \
+    python_buffer
+
+ELEMENTWISE_OPS = {"+": (operator.add, np.add), "*": (operator.mul, np.multiply)}
+
+
+# step of an elementwise program: operand index to push, or an operator applied to the two topmost values
+Step = Union[int, str]
+
+
+class LazyMatrix:
+    """
+    Node of a deferred MyMatrix expression: operators only check dimensions and build the graph,
+    which is evaluated on compute(), str(), indexing or writing to a file.
+    A chain of + and * is evaluated as one postfix program over the buffers of its operands,
+    without intermediate matrices and with NumPy temporaries reused; products of several matrices
+    are multiplied in the order with the fewest scalar multiplications.
+    The value is memoized in the node, so shared subexpressions are computed once.
+    Graphs are walked with explicit stacks, so chains of any length are evaluated.
+    """
+    __slots__ = ("op", "children", "rows", "cols", "_value")
+
+    def __init__(self, op: Optional[str], children: Tuple, rows: int, cols: int):
+        self.op = op  # None for leaves, which hold their MyMatrix as the only child
+        self.children = children
+        self.rows = rows
+        self.cols = cols
+        self._value: Optional[MyMatrix] = None
+
+    @classmethod
+    def leaf(cls, matrix: MyMatrix) -> LazyMatrix:
+        node = cls(None, (matrix,), matrix.rows, matrix.cols)
+        node._value = matrix
+        return node
+
+    @staticmethod
+    def _as_node(other) -> Optional[LazyMatrix]:
+        if isinstance(other, LazyMatrix):
+            return other
+        if isinstance(other, MyMatrix):
+            return LazyMatrix.leaf(other)
+        return None
+
+    def _elementwise_node(self, other, op: str, error: Callable[[str], Exception], reflected: bool = False) \
+            -> LazyMatrix:
+        node = self._as_node(other)
+        if node is None:
+            raise error(f"{'lhs' if reflected else 'rhs'} must be MyMatrix or LazyMatrix, not {type(other)} object")
+        if self.cols != node.cols or self.rows != node.rows:
+            raise error(f"bad dimensions, ({self.cols}, {self.rows}) != ({node.cols}, {node.rows})")
+        return LazyMatrix(op, (node, self) if reflected else (self, node), self.rows, self.cols)
+
+    def __add__(self, other) -> LazyMatrix:  # +
+        return self._elementwise_node(other, "+", AddError)
+
+    def __radd__(self, other) -> LazyMatrix:  # MyMatrix + LazyMatrix
+        return self._elementwise_node(other, "+", AddError, reflected=True)
+
+    def __mul__(self, other) -> LazyMatrix:  # *
+        return self._elementwise_node(other, "*", ElementWiseMultiplyError)
+
+    def __rmul__(self, other) -> LazyMatrix:  # MyMatrix * LazyMatrix
+        return self._elementwise_node(other, "*", ElementWiseMultiplyError, reflected=True)
+
+    def __matmul__(self, other) -> LazyMatrix:  # @
+        node = self._as_node(other)
+        if node is None:
+            raise MathematicalMultiplyError(f"rhs must be MyMatrix or LazyMatrix, not {type(other)} object")
+        if self.cols != node.rows:
+            raise MathematicalMultiplyError(f"bad dimensions, lhs.cols ({self.cols}) != rhs.rows ({node.rows})")
+        return LazyMatrix("@", (self, node), self.rows, node.cols)
+
+    def __rmatmul__(self, other) -> LazyMatrix:  # MyMatrix @ LazyMatrix
+        node = self._as_node(other)
+        if node is None:
+            raise MathematicalMultiplyError(f"lhs must be MyMatrix or LazyMatrix, not {type(other)} object")
+        return node @ self
+
+    def operands(self) -> List[LazyMatrix]:
+        """Nodes whose values the evaluation of this one takes: operands of its chain or factors of its product."""
+        if self.op == "@":
+            return matmul_factors(self)
+        return elementwise_program(self)[0]
+
+    def compute(self) -> MyMatrix:
+        """Evaluates the nodes this one depends on first, deepest first, and memoizes every value."""
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            if node._value is not None:
+                stack.pop()
+                continue
+            pending = [operand for operand in node.operands() if operand._value is None]
+            if pending:
+                stack += pending
+                continue
+            node._value = evaluate_matmul_chain(node) if node.op == "@" else evaluate_elementwise(node)
+            stack.pop()
+        return self._value
+
+    @property
+    def matrix(self):
+        return self.compute().matrix
+
+    def __getitem__(self, key: Tuple[int, int]):
+        return self.compute()[key]
+
+    def __str__(self) -> str:
+        return str(self.compute())
+
+    def write_to_file(self, filename: str) -> NoReturn:
+        self.compute().write_to_file(filename)
+
+    def save(self, filename: str, format: str = None) -> NoReturn:
+        self.compute().save(filename, format)
+
+    def __eq__(self, other) -> bool:
+        return self.compute() == (other.compute() if isinstance(other, LazyMatrix) else other)
+
+    def __hash__(self) -> int:
+        return hash(self.compute())
+
+    def __repr__(self) -> str:
+        if self.op is None:
+            return f"LazyMatrix({self.rows}x{self.cols})"
+        return f"({self.children[0]!r} {self.op} {self.children[1]!r})"
+
+
+def is_fusable(node: LazyMatrix) -> bool:
+    return node.op in ELEMENTWISE_OPS and node._value is None
+
+
+def count_uses(root: LazyMatrix) -> Dict[int, int]:
+    """Counts how many times every node below root is an operand in its + and * chain, by id."""
+    uses: Dict[int, int] = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for child in node.children:
+            uses[id(child)] = uses.get(id(child), 0) + 1
+            if uses[id(child)] == 1 and is_fusable(child):
+                stack.append(child)
+    return uses
+
+
+def elementwise_program(root: LazyMatrix) -> Tuple[List[LazyMatrix], List[Step]]:
+    """
+    Operands of the + and * chain rooted at root (each once, even if repeated) and the chain in postfix order.
+    Computed subexpressions, products and subexpressions used more than once are operands of the chain,
+    the latter are computed once on their own instead of being expanded at every use.
+    """
+    uses = count_uses(root)
+    indices: Dict[int, int] = {}
+    operands: List[LazyMatrix] = []
+    program: List[Step] = []
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            program.append(node.op)
+        elif is_fusable(node) and (node is root or uses[id(node)] == 1):
+            lhs, rhs = node.children
+            stack += [(node, True), (rhs, False), (lhs, False)]
+        else:
+            if id(node) not in indices:
+                indices[id(node)] = len(operands)
+                operands.append(node)
+            program.append(indices[id(node)])
+    return operands, program
+
+
+def run_program(program: List[Step], operands: List, apply: Callable[[str, Any, bool, Any, bool], Any]):
+    """
+    Evaluates the postfix program over operands with apply(op, lhs, lhs_owned, rhs, rhs_owned),
+    where owned values are temporaries of the program which apply may reuse.
+    """
+    stack = []
+    for step in program:
+        if isinstance(step, int):
+            stack.append((operands[step], False))
+        else:
+            rhs, rhs_owned = stack.pop()
+            lhs, lhs_owned = stack.pop()
+            stack.append((apply(step, lhs, lhs_owned, rhs, rhs_owned), True))
+    return stack[0][0]
+
+
+def apply_ndarray(op: str, lhs: np.ndarray, lhs_owned: bool, rhs: np.ndarray, rhs_owned: bool) -> np.ndarray:
+    dtype = np.result_type(lhs, rhs)
+    out = next((x for x, owned in ((lhs, lhs_owned), (rhs, rhs_owned)) if owned and x.dtype == dtype), None)
+    return ELEMENTWISE_OPS[op][1](lhs, rhs, out=out)
+
+
+def apply_python(op: str, lhs: List, lhs_owned: bool, rhs: List, rhs_owned: bool) -> List:
+    return list(map(ELEMENTWISE_OPS[op][0], lhs, rhs))
+
+
+def apply_matrix(op: str, lhs: MyMatrix, lhs_owned: bool, rhs: MyMatrix, rhs_owned: bool) -> MyMatrix:
+    return ELEMENTWISE_OPS[op][0](lhs, rhs)
+
+
+def evaluate_elementwise(node: LazyMatrix) -> MyMatrix:
+    operands, program = elementwise_program(node)
+    matrices = [operand.compute() for operand in operands]  # already computed by LazyMatrix.compute
+
+    if any(matrix._data is None for matrix in matrices):  # e.g. sparse operands have their own kernels
+        return run_program(program, matrices, apply_matrix)
+    if all(isinstance(matrix._data, np.ndarray) for matrix in matrices):
+        result = run_program(program, [matrix._data for matrix in matrices], apply_ndarray)
+        return MyMatrix._from_flat(result, node.rows, node.cols)
+    result = run_program(program, [python_buffer(matrix._data) for matrix in matrices], apply_python)
+    return MyMatrix._from_flat(flat_buffer(result), node.rows, node.cols)
+
+
+def matmul_factors(root: LazyMatrix) -> List[LazyMatrix]:
+    """Factors of the product chain rooted at root from left to right."""
+    factors, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        if node.op == "@" and node._value is None:
+            stack += reversed(node.children)
+        else:
+            factors.append(node)
+    return factors
+
+
+def matmul_chain_order(dims: List[int]) -> List[List[int]]:
+    """
+    Classic dynamic programming over the chain of matrices with i-th of shape (dims[i], dims[i + 1]):
+    returns split[i][j], the last multiplication of the cheapest order of factors i..j.
+    """
+    n = len(dims) - 1
+    cost = [[0] * n for _ in range(n)]
+    split = [[0] * n for _ in range(n)]
+    for length in range(2, n + 1):
+        for i in range(n - length + 1):
+            j = i + length - 1
+            cost[i][j] = None
+            for k in range(i, j):
+                candidate = cost[i][k] + cost[k + 1][j] + dims[i] * dims[k + 1] * dims[j + 1]
+                if cost[i][j] is None or candidate < cost[i][j]:
+                    cost[i][j], split[i][j] = candidate, k
+    return split
+
+
+def evaluate_matmul_chain(node: LazyMatrix) -> MyMatrix:
+    factors = matmul_factors(node)
+    dims = [factors[0].rows] + [factor.cols for factor in factors]
+    split = matmul_chain_order(dims)
+
+    # the split tree in postfix order: a factor is pushed, a product of the two topmost values replaces them
+    program: List[Step] = []
+    stack = [(0, len(factors) - 1, False)]
+    while stack:
+        i, j, expanded = stack.pop()
+        if expanded:
+            program.append("@")
+        elif i == j:
+            program.append(i)
+        else:
+            k = split[i][j]
+            stack += [(i, j, True), (k + 1, j, False), (i, k, False)]
+    return run_program(program, [factor.compute() for factor in factors],
+                       lambda op, lhs, lhs_owned, rhs, rhs_owned: lhs @ rhs)
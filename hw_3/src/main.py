@@ -1,6 +1,7 @@
 import copy
 import os
-from typing import NoReturn, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import NoReturn, Optional, Tuple, Union
 
 import numpy as np
 
@@ -20,9 +21,9 @@ def create_easy_matrix_artifacts() -> NoReturn:
     matrix_b = MyMatrix(np.random.randint(0, 10, (10, 10)))
 
     output_directory = "../artifacts/easy/"
-    write_to_file(str(matrix_a + matrix_b), f"{output_directory}matrix+.txt")
-    write_to_file(str(matrix_a * matrix_b), f"{output_directory}matrix*.txt")
-    write_to_file(str(matrix_a @ matrix_b), f"{output_directory}matrix@.txt")
+    (matrix_a + matrix_b).write_to_file(f"{output_directory}matrix+.txt")
+    (matrix_a * matrix_b).write_to_file(f"{output_directory}matrix*.txt")
+    (matrix_a @ matrix_b).write_to_file(f"{output_directory}matrix@.txt")
 
 
 def create_medium_matrix_artifacts() -> NoReturn:
@@ -36,16 +37,39 @@ def create_medium_matrix_artifacts() -> NoReturn:
     (matrix_a @ matrix_b).write_to_file(f"{output_directory}matrix@.txt")
 
 
-def find_hash_collision(iters=int(1e6)) -> Union[Tuple[MyMatrix, MyMatrix], None]:
-    np.random.seed(0)
-    for _ in range(iters):
-        lhs = MyMatrix(np.random.randint(0, 10, (10, 10)))
-        rhs = MyMatrix(np.random.randint(0, 10, (10, 10)))
-        if lhs != rhs and hash(lhs) == hash(rhs):
+def find_hash_collision_in_block(seed: int, block_size: int, rows: int = 10, cols: int = 10) \
+        -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Generates block_size random matrices at once, hashes all of them with one vectorized expression
+    and looks for two different matrices among neighbours in the hash-sorted block.
+    """
+    candidates = np.random.RandomState(seed).randint(0, 10, (block_size, rows, cols))
+    hashes = MyMatrix.hashes_from_sums(candidates.reshape(block_size, -1).sum(axis=1), rows, cols)
+    order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+    for k in np.flatnonzero(sorted_hashes[1:] == sorted_hashes[:-1]):
+        lhs, rhs = candidates[order[k]], candidates[order[k + 1]]
+        if not np.array_equal(lhs, rhs):
             return lhs, rhs
     return None
 
 
+def find_hash_collision(iters=int(1e6), block_size: int = 256, n_jobs: int = 1) \
+        -> Union[Tuple[MyMatrix, MyMatrix], None]:
+    """Searches iters candidates in blocks, blocks are sharded over a process pool if n_jobs > 1."""
+    seeds = range((iters + block_size - 1) // block_size)
+    block_sizes = [min(block_size, iters - seed * block_size) for seed in seeds]
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            collision = next(filter(None, executor.map(find_hash_collision_in_block, seeds, block_sizes)), None)
+            executor.shutdown(cancel_futures=True)
+    else:
+        collision = next(filter(None, map(find_hash_collision_in_block, seeds, block_sizes)), None)
+    if collision is None:
+        return None
+    return MyMatrix(collision[0]), MyMatrix(collision[1])
+
+
 def create_hard_matrix_artifacts() -> NoReturn:
     matrix_a, matrix_c = find_hash_collision()
     matrix_b = MyMatrix(np.eye(10, dtype=int))
@@ -57,19 +81,20 @@ def create_hard_matrix_artifacts() -> NoReturn:
     MyMatrix.clear_cache()
     real_cd_prod = matrix_c @ matrix_d
 
+    # the matmul cache checks operands contents on hit, so colliding hashes don't return AB for CD
     if not ((hash(matrix_a) == hash(matrix_c)) and (matrix_a != matrix_c) and (matrix_b == matrix_d) and (
-            ab_prod != real_cd_prod) and (ab_prod == cached_cd_prod)):
+            ab_prod != real_cd_prod) and (cached_cd_prod == real_cd_prod)):
         print("Hard unexpectedly failed")
         return
 
     output_directory = "../artifacts/hard/"
-    write_to_file(str(matrix_a), f"{output_directory}A.txt")
-    write_to_file(str(matrix_b), f"{output_directory}B.txt")
-    write_to_file(str(matrix_c), f"{output_directory}C.txt")
-    write_to_file(str(matrix_d), f"{output_directory}D.txt")
+    matrix_a.write_to_file(f"{output_directory}A.txt")
+    matrix_b.write_to_file(f"{output_directory}B.txt")
+    matrix_c.write_to_file(f"{output_directory}C.txt")
+    matrix_d.write_to_file(f"{output_directory}D.txt")
 
-    write_to_file(str(ab_prod), f"{output_directory}AB.txt")
-    write_to_file(str(real_cd_prod), f"{output_directory}CD.txt")
+    ab_prod.write_to_file(f"{output_directory}AB.txt")
+    real_cd_prod.write_to_file(f"{output_directory}CD.txt")
     write_to_file(str(hash(ab_prod)) + "\n" + str(hash(real_cd_prod)), f"{output_directory}hash.txt")
 
 
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, NoReturn, Tuple, TypeVar
+
+import numpy as np
+
+Matrix = TypeVar("Matrix")
+
+
+def raw_content(matrix) -> bytes:
+    """Exact content of a flat buffer backed matrix: shape, element type and raw elements."""
+    data = matrix._data
+    if isinstance(data, np.ndarray):
+        kind, payload = data.dtype.str, np.ascontiguousarray(data).tobytes()
+    elif isinstance(data, array):
+        kind, payload = data.typecode, data.tobytes()
+    else:
+        kind, payload = "list", repr(data).encode()
+    return f"{kind}:{matrix.rows}x{matrix.cols}:".encode() + payload
+
+
+def fingerprint(content: bytes) -> bytes:
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def matrix_fingerprint(matrix) -> bytes:
+    """Fingerprint memoized in the matrix until it is mutated."""
+    if matrix._fingerprint is None:
+        matrix._fingerprint = fingerprint(raw_content(matrix))
+    return matrix._fingerprint
+
+
+def snapshot(matrix: Matrix) -> Matrix:
+    """Copy of the matrix which is safe to keep while the original may be mutated."""
+    return type(matrix)._from_flat(copy.copy(matrix._data), matrix.rows, matrix.cols)
+
+
+def matrix_size(matrix) -> int:
+    data = matrix._data
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, array):
+        return data.itemsize * len(data)
+    return 8 * len(data)
+
+
+class MatmulCache:
+    """
+    LRU cache of matrix products keyed by blake2b fingerprints of both operands. Copies of operands
+    are kept with the result and compared on hit, so fingerprint collisions can't return a wrong product.
+    Results are copied in and out, so mutating them doesn't corrupt the cache.
+    Least recently used entries are evicted above max_entries or max_bytes of stored matrices.
+    The default cache is shared by all threads, so entries are looked up, inserted and evicted under a lock;
+    products and copies are computed outside of it.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (lhs fingerprint, rhs fingerprint) -> (lhs copy, rhs copy, product copy, entry size)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get_or_compute(self, lhs: Matrix, rhs: Matrix, compute: Callable[[], Matrix]) -> Matrix:
+        key = (matrix_fingerprint(lhs), matrix_fingerprint(rhs))
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+        # entries are never mutated, so the copies are compared outside of the lock
+        if entry is not None and entry[0] == lhs and entry[1] == rhs:
+            with self._lock:
+                self.hits += 1
+                if self._entries.get(key, None) is entry:
+                    self._entries.move_to_end(key)
+            return snapshot(entry[2])
+
+        with self._lock:
+            self.misses += 1
+        result = compute()
+        size = matrix_size(lhs) + matrix_size(rhs) + matrix_size(result)
+        new_entry = (snapshot(lhs), snapshot(rhs), snapshot(result), size) if size <= self.max_bytes else None
+        with self._lock:
+            if key in self._entries:  # a stale entry or the same product stored by another thread meanwhile
+                self._remove(key)
+            if new_entry is not None:
+                self._entries[key] = new_entry
+                self.size_bytes += size
+                while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        return result
+
+    def _remove(self, key: Tuple[bytes, bytes]) -> NoReturn:  # under the lock
+        self.size_bytes -= self._entries.pop(key)[3]
+
+    def clear(self) -> NoReturn:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size_bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+_current_cache: ContextVar[MatmulCache] = ContextVar("matmul_cache", default=MatmulCache())
+
+
+def current_matmul_cache() -> MatmulCache:
+    return _current_cache.get()
+
+
+@contextmanager
+def use_matmul_cache(cache: MatmulCache) -> Iterator[MatmulCache]:
+    """Makes cache the one used by matrix products inside the with block of the current context."""
+    token = _current_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _current_cache.reset(token)
@@ -1,34 +1,112 @@
 from __future__ import annotations
 
-import copy
-from typing import NoReturn
+import operator
+from array import array
+from itertools import chain
+from typing import Callable, Iterable, List, NoReturn, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import serializers
+from matmul_cache import current_matmul_cache
+
+# row-major elements: int64 or double array, NumPy array for ndarray-backed matrices,
+# list for elements which fit none of them (e.g. arbitrary precision ints)
+FlatBuffer = Union[array, np.ndarray, list]
+
+
+# ints up to 2 ** 53 in magnitude are exactly representable as doubles
+MAX_EXACT_DOUBLE_INT = 2 ** 53
+
+
+def fits_double(values: List) -> bool:
+    """Whether array("d") holds values exactly: Fractions, Decimals and bigger ints would be rounded."""
+    return all(isinstance(value, float)
+               or isinstance(value, (int, np.integer)) and -MAX_EXACT_DOUBLE_INT <= value <= MAX_EXACT_DOUBLE_INT
+               for value in values)
+
+
+def flat_buffer(values: Iterable, typecode: str = None) -> FlatBuffer:
+    """Packs values into the most compact buffer holding them exactly: int64 array, double array or list."""
+    # array() consumes an iterator up to the element which doesn't fit, so every attempt must start from a list
+    values = values if isinstance(values, list) else list(values)
+    if typecode is not None and (typecode != "d" or fits_double(values)):
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            pass  # the typecode does not fit, fall back to the general path
+    try:
+        return array("q", values)
+    except OverflowError:
+        return values
+    except TypeError:
+        pass
+    return array("d", values) if fits_double(values) else values
+
+
+def buffers_equal(lhs: FlatBuffer, rhs: FlatBuffer) -> bool:
+    if isinstance(lhs, np.ndarray) or isinstance(rhs, np.ndarray):
+        return bool(np.array_equal(lhs, rhs))
+    if type(lhs) is type(rhs):
+        return lhs == rhs
+    return list(lhs) == list(rhs)
+
+
+def _is_int64(data: FlatBuffer) -> bool:
+    return isinstance(data, array) and data.typecode == "q"
+
+
+def python_buffer(data: FlatBuffer) -> Sequence:
+    """Returns data as a list of Python numbers, which is the fastest to iterate over in pure Python."""
+    return data.tolist() if isinstance(data, (array, np.ndarray)) else data
 
 
 class HashEqMatrixMixin:
+    __slots__ = ("_data", "rows", "cols", "_elements_hash")
+    modulo = 103
+
     def __init__(self):
-        self.matrix = None
+        self._data = None
         self.rows = None
         self.cols = None
-        self.modulo = 103
+        self._elements_hash = None
 
     def __hash__(self) -> int:
         """
         Computes hash using built-in hash for tuple of inner matrix hash, rows and cols,
         then takes it modulo self.modulo;
-        inner matrix hash computes as sum of elements of matrix modulo self.modulo.
+        inner matrix hash computes as sum of elements of matrix modulo self.modulo,
+        it is memoized until the matrix is mutated.
         """
-        matrix_hash = 0
-        for row in self.matrix:
-            for el in row:
-                matrix_hash += el
-            matrix_hash %= self.modulo
-        return hash((matrix_hash, self.rows, self.cols)) % self.modulo
+        if self._elements_hash is None:
+            self._elements_hash = self._elements_sum() % self.modulo
+        return hash((self._elements_hash, self.rows, self.cols)) % self.modulo
+
+    def _elements_sum(self):
+        return self._data.sum() if isinstance(self._data, np.ndarray) else sum(self._data)
+
+    @classmethod
+    def hashes_from_sums(cls, sums: np.ndarray, rows: int, cols: int) -> np.ndarray:
+        """Vectorized __hash__ of a batch of rows x cols matrices given their element sums."""
+        lookup = np.array([hash((elements_hash, rows, cols)) % cls.modulo for elements_hash in range(cls.modulo)])
+        return lookup[sums % cls.modulo]
+
+    def _update_elements_hash(self, old_value, new_value) -> NoReturn:
+        """Patches the memoized sum-based hash after an element write, floats invalidate it to avoid rounding drift."""
+        if self._elements_hash is None:
+            return
+        if isinstance(old_value, (int, np.integer)) and isinstance(new_value, (int, np.integer)):
+            self._elements_hash = (self._elements_hash - old_value + new_value) % self.modulo
+        else:
+            self._elements_hash = None
 
     def __eq__(self, other) -> bool:
-        matrix_eq = self.matrix == other.matrix
-        if not isinstance(matrix_eq, bool):
-            matrix_eq = matrix_eq.all()
-        return self.rows == other.rows and self.cols == other.cols and matrix_eq
+        return self.rows == other.rows and self.cols == other.cols and buffers_equal(self._data, other._data)
+
+
+def is_lazy(x) -> bool:
+    from lazy_matrix import LazyMatrix
+    return isinstance(x, LazyMatrix)
 
 
 class MyMatrixError(Exception):
@@ -57,73 +135,261 @@ class MathematicalMultiplyError(MyMatrixError):
         super().__init__("MyMatrix mathematical multiply is invalid, cause: " + cause)
 
 
+def blocked_matmul(lhs: Sequence, rhs: Sequence, rows: int, inner: int, cols: int, tile_size: int) -> List:
+    """
+    Multiplies row-major flat lists tile by tile of the result: every element is an inner product
+    of a lhs row and a rhs column computed by sum(map(operator.mul, ...)),
+    and a tile of rhs columns is reused by tile_size consecutive lhs rows.
+    """
+    lhs_rows = [lhs[i * inner:(i + 1) * inner] for i in range(rows)]
+    rhs_columns = [rhs[j::cols] for j in range(cols)]
+    result = [0] * (rows * cols)
+    mul = operator.mul
+    for col_start in range(0, cols, tile_size):
+        columns_tile = rhs_columns[col_start:col_start + tile_size]
+        for row_start in range(0, rows, tile_size):
+            for i in range(row_start, min(row_start + tile_size, rows)):
+                lhs_row = lhs_rows[i]
+                for j, column in enumerate(columns_tile, i * cols + col_start):
+                    result[j] = sum(map(mul, lhs_row, column))
+    return result
+
+
+# unsigned array typecodes by item size, the slots of packed_int_matmul
+SLOT_TYPECODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+def packed_int_matmul(lhs: Sequence[int], rhs: Sequence[int], rows: int, inner: int, cols: int) -> Optional[List[int]]:
+    """
+    Multiplies row-major flat int lists by Kronecker substitution: every rhs row is packed into one big int
+    with an unsigned slot per column, so a result row is inner big int multiply-adds, done in C,
+    instead of rows * cols Python level inner products. Elements are shifted to be non-negative
+    and the shifts are subtracted afterwards. Returns None if the slot sums could exceed 64 bits.
+    """
+    lhs_shift, rhs_shift = max(0, -min(lhs)), max(0, -min(rhs))
+    bound = inner * (max(lhs) + lhs_shift) * (max(rhs) + rhs_shift)  # of every slot sum
+    slot_size = next((size for size in SLOT_TYPECODES if bound < 1 << (8 * size)), None)
+    if slot_size is None:
+        return None
+    typecode = SLOT_TYPECODES[slot_size]
+
+    packed_rows = [int.from_bytes(array(typecode, [value + rhs_shift for value in rhs[k * cols:(k + 1) * cols]]),
+                                  "little") for k in range(inner)]
+    result = []
+    mul = operator.mul
+    for i in range(rows):
+        lhs_row = lhs[i * inner:(i + 1) * inner]
+        if lhs_shift:
+            lhs_row = [value + lhs_shift for value in lhs_row]
+        packed_sum = sum(map(mul, lhs_row, packed_rows))
+        result += array(typecode, packed_sum.to_bytes(cols * slot_size, "little")).tolist()
+        if rhs_shift:  # (lhs + lhs_shift) @ rhs = packed - rhs_shift * sum(shifted lhs row)
+            correction = rhs_shift * sum(lhs_row)
+            result[-cols:] = [value - correction for value in result[-cols:]]
+
+    if lhs_shift:  # lhs @ rhs = (lhs + lhs_shift) @ rhs - lhs_shift * column sums of rhs
+        corrections = [lhs_shift * sum(rhs[j::cols]) for j in range(cols)]
+        result = [value - correction for value, correction in zip(result, corrections * rows)]
+    return result
+
+
 class MyMatrix(HashEqMatrixMixin):
-    matmul_cache = {}
+    __slots__ = ("_fingerprint",)  # content fingerprint memoized by the matmul cache
+    matmul_tile_size = 64
+    # pure Python operands of matmul with at least sparse_min_elements elements
+    # and at most sparse_density_threshold nonzero ones are multiplied as sparse
+    sparse_density_threshold = 0.1
+    sparse_min_elements = 1024
+    # products of at least parallel_min_operations multiplications are split by rows
+    # between matmul_jobs worker processes, 1 keeps them serial
+    matmul_jobs = 1
+    parallel_min_operations = 1 << 21
 
     def __init__(self, matrix):
         super().__init__()
-        self.matrix = matrix
-
-        self.rows = len(matrix)
+        self._fingerprint = None
+        if isinstance(matrix, np.ndarray):
+            if matrix.ndim != 2:
+                raise InvalidDimensionsInitError(f"ndarray has {matrix.ndim} dims instead of 2")
+            self.rows, self.cols = matrix.shape
+        else:
+            self.rows = len(matrix)
+            self.cols = len(matrix[0]) if self.rows != 0 else 0
         if self.rows == 0:
             raise InvalidDimensionsInitError("zero rows")
-        self.cols = len(matrix[0])
         if self.cols == 0:
             raise InvalidDimensionsInitError("zero cols")
 
+        if isinstance(matrix, np.ndarray):
+            self._data = matrix.flatten()
+            return
         for index, row in enumerate(matrix):
-            if len(row) != self.rows:
+            if len(row) != self.cols:
                 raise InvalidDimensionsInitError(f"len(row[{index}]) != len(row[0])")
+        self._data = flat_buffer(chain.from_iterable(matrix))
+
+    @classmethod
+    def _from_flat(cls, data: FlatBuffer, rows: int, cols: int) -> MyMatrix:
+        """Wraps an already valid row-major buffer skipping all checks and copies."""
+        matrix = cls.__new__(cls)
+        matrix._data = data
+        matrix.rows = rows
+        matrix.cols = cols
+        matrix._elements_hash = None
+        matrix._fingerprint = None
+        return matrix
+
+    @property
+    def matrix(self) -> Union[np.ndarray, List[List]]:
+        if isinstance(self._data, np.ndarray):
+            # writes must go through __setitem__, which keeps the memoized hash and fingerprint valid
+            view = self._data.reshape(self.rows, self.cols)
+            view.flags.writeable = False
+            return view
+        return [list(self.row(i)) for i in range(self.rows)]
+
+    def row(self, i: int) -> Sequence:
+        return self._data[i * self.cols:(i + 1) * self.cols]
+
+    def _index(self, key: Tuple[int, int]) -> int:
+        i, j = key
+        if not (0 <= i < self.rows and 0 <= j < self.cols):
+            raise IndexError(f"MyMatrix index ({i}, {j}) out of range ({self.rows}, {self.cols})")
+        return i * self.cols + j
+
+    def __getitem__(self, key: Tuple[int, int]):
+        return self._data[self._index(key)]
+
+    def __setitem__(self, key: Tuple[int, int], value) -> NoReturn:
+        index = self._index(key)
+        old_value = self._data[index]
+        try:
+            self._data[index] = value
+        except (TypeError, OverflowError):  # value doesn't fit the array type
+            data = list(self._data)
+            data[index] = value
+            self._data = flat_buffer(data)
+        self._update_elements_hash(old_value, self._data[index])
+        self._fingerprint = None
 
     def __str__(self) -> str:
-        return "\n".join(map(lambda row: " | ".join(map(str, row)), self.matrix))
+        return "\n".join(map(lambda i: " | ".join(map(str, self.row(i))), range(self.rows)))
+
+    def density(self) -> float:
+        data = self._data
+        if isinstance(data, np.ndarray):
+            nonzero = np.count_nonzero(data)
+        elif isinstance(data, array):
+            nonzero = len(data) - data.count(0)
+        else:
+            nonzero = sum(1 for value in data if value)
+        return nonzero / len(data)
+
+    def _prefers_sparse(self) -> bool:
+        # NumPy dense products are faster than pure Python sparse ones
+        return not isinstance(self._data, np.ndarray) and self.rows * self.cols >= self.sparse_min_elements \
+            and self.density() <= self.sparse_density_threshold
+
+    def _elementwise(self, other: MyMatrix, op: Callable) -> MyMatrix:
+        lhs, rhs = self._data, other._data
+        if isinstance(lhs, np.ndarray) and isinstance(rhs, np.ndarray):
+            return MyMatrix._from_flat(op(lhs, rhs), self.rows, self.cols)
+        typecode = None
+        if isinstance(lhs, array) and isinstance(rhs, array):
+            typecode = "q" if lhs.typecode == rhs.typecode == "q" else "d"
+        return MyMatrix._from_flat(flat_buffer(map(op, lhs, rhs), typecode), self.rows, self.cols)
 
     def __add__(self, other) -> MyMatrix:  # +
         if not isinstance(other, MyMatrix):
+            if is_lazy(other):
+                return NotImplemented  # LazyMatrix builds the node
             raise AddError(f"rhs must be MyMatrix, not {type(other)} object")
         if self.cols != other.cols or self.rows != other.rows:
             raise AddError(f"bad dimensions, ({self.cols}, {self.rows}) != ({other.cols}, {other.rows})")
-
-        result_matrix = copy.deepcopy(self.matrix)
-        for i in range(self.rows):
-            for j in range(self.cols):
-                result_matrix[i][j] += other.matrix[i][j]
-        return MyMatrix(result_matrix)
+        return self._elementwise(other, operator.add)
 
     def __mul__(self, other) -> MyMatrix:  # *
         if not isinstance(other, MyMatrix):
+            if is_lazy(other):
+                return NotImplemented  # LazyMatrix builds the node
             raise ElementWiseMultiplyError(f"rhs must be MyMatrix, not {type(other)} object")
-        if self.cols != other.rows:
+        if self.cols != other.cols or self.rows != other.rows:
             raise ElementWiseMultiplyError(
                 f"bad dimensions, ({self.cols}, {self.rows}) != ({other.cols}, {other.rows})")
-
-        result_matrix = copy.deepcopy(self.matrix)
-        for i in range(self.rows):
-            for j in range(self.cols):
-                result_matrix[i][j] *= other.matrix[i][j]
-        return MyMatrix(result_matrix)
+        return self._elementwise(other, operator.mul)
 
     def __matmul__(self, other) -> MyMatrix:  # @
         if not isinstance(other, MyMatrix):
+            if is_lazy(other):
+                return NotImplemented  # LazyMatrix builds the node
             raise MathematicalMultiplyError(f"rhs must be MyMatrix, not {type(other)} object")
         if self.cols != other.rows:
             raise MathematicalMultiplyError(f"bad dimensions, lhs.cols ({self.cols}) != rhs.rows ({other.rows})")
 
-        cache_key = (hash(self), hash(other))
-        cache_result = MyMatrix.matmul_cache.get(cache_key, None)
-        if cache_result is not None:
-            return cache_result
+        lhs_sparse, rhs_sparse = self._prefers_sparse(), other._prefers_sparse()
+        if lhs_sparse or rhs_sparse:
+            from sparse_matrix import SparseMyMatrix
+            lhs = SparseMyMatrix.from_dense(self) if lhs_sparse else self
+            rhs = SparseMyMatrix.from_dense(other) if rhs_sparse else other
+            result = lhs @ rhs
+            return result.to_dense() if isinstance(result, SparseMyMatrix) else result
+        return current_matmul_cache().get_or_compute(self, other, lambda: self._matmul(other))
+
+    def _matmul(self, other: MyMatrix) -> MyMatrix:
+        from parallel_matmul import should_parallelize
+        if should_parallelize(MyMatrix.matmul_jobs, self.rows, self.cols, other.cols,
+                              MyMatrix.parallel_min_operations, self._data, other._data):
+            return self._parallel_matmul(other)
+        if isinstance(self._data, np.ndarray) and isinstance(other._data, np.ndarray):
+            product = self._data.reshape(self.rows, self.cols) @ other._data.reshape(other.rows, other.cols)
+            return MyMatrix._from_flat(product.ravel(), self.rows, other.cols)
+        lhs, rhs = python_buffer(self._data), python_buffer(other._data)
+        product = None
+        if _is_int64(self._data) and _is_int64(other._data):
+            product = packed_int_matmul(lhs, rhs, self.rows, self.cols, other.cols)
+        if product is None:
+            product = blocked_matmul(lhs, rhs, self.rows, self.cols, other.cols, MyMatrix.matmul_tile_size)
+        return MyMatrix._from_flat(flat_buffer(product), self.rows, other.cols)
+
+    def _parallel_matmul(self, other: MyMatrix) -> MyMatrix:
+        from parallel_matmul import parallel_flat_matmul, parallel_ndarray_matmul
+        if isinstance(self._data, np.ndarray):
+            product = parallel_ndarray_matmul(self._data.reshape(self.rows, self.cols),
+                                              other._data.reshape(other.rows, other.cols), MyMatrix.matmul_jobs)
+            return MyMatrix._from_flat(product.ravel(), self.rows, other.cols)
+        product = parallel_flat_matmul(self._data, other._data, self.rows, self.cols, other.cols,
+                                       MyMatrix.matmul_jobs, MyMatrix.matmul_tile_size)
+        return MyMatrix._from_flat(product, self.rows, other.cols)
+
+    def lazy(self):
+        """Starts a deferred expression: operators on the result build a LazyMatrix graph instead of computing."""
+        from lazy_matrix import LazyMatrix
+        return LazyMatrix.leaf(self)
+
+    @property
+    def matrix_data(self) -> serializers.MatrixData:
+        return self.rows, self.cols, self._data
+
+    def save(self, filename: str, format: str = None) -> NoReturn:
+        """Format (txt, npy or compact binary mym, optionally .gz/.bz2/.xz compressed) is taken from filename."""
+        serializers.save(filename, *self.matrix_data, format)
+
+    def write_to_file(self, filename: str) -> NoReturn:
+        self.save(filename, "txt")
 
-        result_matrix = [[0 for _ in range(other.cols)] for _ in range(self.rows)]
-        for i in range(self.rows):
-            for k in range(self.cols):
-                for j in range(other.cols):
-                    result_matrix[i][j] += self.matrix[i][k] * other.matrix[k][j]
-        result = MyMatrix(result_matrix)
+    @classmethod
+    def from_data(cls, rows: int, cols: int, data) -> MyMatrix:
+        if isinstance(data, np.ndarray):
+            return cls(data.reshape(rows, cols))
+        return cls._from_flat(data if isinstance(data, array) else flat_buffer(data), rows, cols)
 
-        MyMatrix.matmul_cache[cache_key] = result
-        return result
+    @classmethod
+    def load(cls, filename: str, format: str = None) -> MyMatrix:
+        rows, cols, data = serializers.load(filename, format)
+        if rows == 0 or cols == 0:
+            raise InvalidDimensionsInitError(f"{filename} holds no elements")
+        return cls.from_data(rows, cols, data)
 
     @staticmethod
     def clear_cache() -> NoReturn:
-        MyMatrix.matmul_cache = {}
+        current_matmul_cache().clear()
@@ -1,23 +1,105 @@
 import numbers
 import os
-from typing import NoReturn
+import tempfile
+from typing import NoReturn, Optional, Tuple
 
 import numpy as np
 
+import serializers
+from parallel_matmul import parallel_ndarray_matmul, should_parallelize
+
+
+def as_ndarray(matrix) -> np.ndarray:
+    """np.asarray which keeps memory-mapped arrays memory-mapped."""
+    return matrix if isinstance(matrix, np.memmap) else np.asarray(matrix)
+
+
+def is_out_of_core(x) -> bool:
+    return isinstance(x, np.memmap)
+
+
+def open_temporary_memmap(shape: Tuple[int, ...], dtype, directory: Optional[str] = None) -> np.memmap:
+    """Disk-backed array in a temporary .npy file, which is unlinked right away where the OS allows it."""
+    fd, filename = tempfile.mkstemp(suffix=".npy", dir=directory)
+    os.close(fd)
+    result = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+    try:
+        os.remove(filename)  # the mapping stays valid on POSIX
+    except OSError:
+        pass
+    return result
+
+
+def blocked_matmul_out_of_core(lhs: np.ndarray, rhs: np.ndarray, out: np.ndarray, block_bytes: int,
+                               directory: Optional[str] = None) -> np.ndarray:
+    """
+    out = lhs @ rhs by square tiles, so only three tiles of block_bytes / 3 are in memory at a time.
+    If out overlaps an operand (e.g. A @= B), finished tiles would overwrite rows later tiles still read,
+    so the product goes to a temporary memory-mapped array in directory and is copied into out at the end.
+    """
+    if np.shares_memory(out, lhs) or np.shares_memory(out, rhs):
+        product = blocked_matmul_out_of_core(lhs, rhs, open_temporary_memmap(out.shape, out.dtype, directory),
+                                             block_bytes)
+        out[...] = product
+        return out
+    side = max(1, int((block_bytes / 3 / out.itemsize) ** 0.5))
+    rows, inner, cols = lhs.shape[0], lhs.shape[1], rhs.shape[1]
+    for row_start in range(0, rows, side):
+        row_stop = min(row_start + side, rows)
+        for col_start in range(0, cols, side):
+            col_stop = min(col_start + side, cols)
+            tile = np.zeros((row_stop - row_start, col_stop - col_start), dtype=out.dtype)
+            for inner_start in range(0, inner, side):
+                inner_stop = min(inner_start + side, inner)
+                tile += np.asarray(lhs[row_start:row_stop, inner_start:inner_stop]) @ \
+                    np.asarray(rhs[inner_start:inner_stop, col_start:col_stop])
+            out[row_start:row_stop, col_start:col_stop] = tile
+    return out
+
+
+def slotted_mixin(mixin: type) -> type:
+    """
+    The mixin itself if it declares __slots__, otherwise its copy which does:
+    a single base without them gives every instance a __dict__.
+    """
+    if "__slots__" in vars(mixin):
+        return mixin
+    namespace = {name: value for name, value in vars(mixin).items() if name not in ("__dict__", "__weakref__")}
+    return type(mixin.__name__, mixin.__bases__, {**namespace, "__slots__": ()})
+
+
+# older NumPy releases, e.g. 1.22 from requirements.txt, declare no __slots__ in NDArrayOperatorsMixin
+NDArrayOperatorsMixin = slotted_mixin(np.lib.mixins.NDArrayOperatorsMixin)
+
 
 class StrMatrixMixin:
-    def __init__(self):
-        self._matrix = None
+    __slots__ = ()
 
     def __str__(self) -> str:
-        return "\n".join(map(lambda row: " | ".join(map(str, row)), self._matrix))
+        return "\n".join(map(lambda row: " | ".join(map(str, row)), self.matrix))
 
 
 class WriteToFileMixin:
+    __slots__ = ()
+
     def write_to_file(self, filename: str) -> NoReturn:
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, "w") as file:
-            file.write(str(self))
+        """Streams str(self) table row by row."""
+        self.save(filename, "txt")
+
+    @property
+    def matrix_data(self) -> serializers.MatrixData:
+        return self.matrix.shape[0], self.matrix.shape[1], self.matrix
+
+    def save(self, filename: str, format: Optional[str] = None) -> NoReturn:
+        """Format (txt, npy or compact binary mym, optionally .gz/.bz2/.xz compressed) is taken from filename."""
+        serializers.save(filename, *self.matrix_data, format)
+
+    def save_npy(self, filename: str) -> NoReturn:
+        """np.save writes contiguous arrays straight from their buffer, so memory-mapped matrices aren't loaded."""
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.save(filename, self.matrix)
 
 
 class NdarrayError(Exception):
@@ -27,6 +109,8 @@ class NdarrayError(Exception):
 
 
 class PropertiesNdarrayMixin:
+    __slots__ = ("_ndarray",)  # the only buffer of the matrix
+
     def __init__(self):
         self._ndarray = None
 
@@ -44,21 +128,53 @@ class PropertiesNdarrayMixin:
 
     @matrix.setter
     def matrix(self, new_matrix):
-        self._ndarray = np.asarray(new_matrix)
+        self._ndarray = as_ndarray(new_matrix)
         if self._ndarray.ndim < 2:
             raise NdarrayError(
                 f"matrix setter failed: not enough dims in np.asarray(new_matrix) = {self._ndarray.ndim}")
 
 
-class NumpyMatrix(np.lib.mixins.NDArrayOperatorsMixin, StrMatrixMixin, WriteToFileMixin, PropertiesNdarrayMixin):
+class NumpyMatrix(NDArrayOperatorsMixin, StrMatrixMixin, WriteToFileMixin, PropertiesNdarrayMixin):
+    # element-wise ufuncs and matmul over memory-mapped operands process blocks of about this size
+    out_of_core_block_bytes = 64 * 1024 * 1024
+    # directory for memory-mapped results, None for the system temporary directory
+    out_of_core_dir = None
+    # in-memory products of at least parallel_min_operations multiplications are split by rows
+    # between matmul_jobs worker processes, 1 keeps them serial
+    matmul_jobs = 1
+    parallel_min_operations = 1 << 24
+
+    __slots__ = ()
+    # ndarray binary operators defer to NumpyMatrix ones
+    __array_priority__ = 1000
+
     def __init__(self, ndarray_matrix):
         super().__init__()
-        self.ndarray_matrix = np.asarray(ndarray_matrix)
         self.matrix = ndarray_matrix  # check dims in mixin setter
-        self._matrix = self.ndarray_matrix
+
+    @classmethod
+    def _wrap(cls, ndarray: np.ndarray):
+        """Fast path for results of operations: wraps ndarray without conversion and checks."""
+        wrapper = cls.__new__(cls)
+        wrapper._ndarray = ndarray
+        return wrapper
+
+    @property
+    def ndarray_matrix(self) -> np.ndarray:
+        return self._ndarray
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        if dtype is not None and dtype != self._ndarray.dtype:
+            return self._ndarray.astype(dtype)
+        return self._ndarray.copy() if copy else self._ndarray
 
     _HANDLED_TYPES = (np.ndarray, numbers.Number)
 
+    def _wrap_result(self, result):
+        if isinstance(result, np.ndarray) and result.ndim >= 2:
+            return self._wrap(result)
+        return type(self)(result)  # checks dims as before
+
     def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
         out = kwargs.get('out', ())
 
@@ -68,20 +184,84 @@ class NumpyMatrix(np.lib.mixins.NDArrayOperatorsMixin, StrMatrixMixin, WriteToFi
                 return NotImplemented
 
         # unpack
-        inputs = tuple(x.ndarray_matrix if isinstance(x, NumpyMatrix) else x
+        inputs = tuple(x._ndarray if isinstance(x, NumpyMatrix) else x
                        for x in inputs)
         if out:
             kwargs['out'] = tuple(
-                x.ndarray_matrix if isinstance(x, NumpyMatrix) else x
+                x._ndarray if isinstance(x, NumpyMatrix) else x
                 for x in out)
-        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if method == '__call__' and ufunc.nout == 1 and any(map(is_out_of_core, inputs + kwargs.get('out', ()))):
+            result = self._out_of_core_ufunc(ufunc, inputs, **kwargs)
+            if result is NotImplemented:
+                result = getattr(ufunc, method)(*inputs, **kwargs)
+        elif ufunc is np.matmul and method == '__call__' and not kwargs and self._parallelizes(*inputs):
+            result = parallel_ndarray_matmul(*inputs, self.matmul_jobs)
+        else:
+            result = getattr(ufunc, method)(*inputs, **kwargs)
 
-        if type(result) is tuple:
-            return tuple(type(self)(x) for x in result)
-        elif method == 'at':
+        if method == 'at':
             return None
-        else:
-            return type(self)(result)
+        # in-place operators (+=, @=, ...) write into out, so the wrappers passed as out are the results
+        if out and all(isinstance(x, NumpyMatrix) for x in out):
+            return out if type(result) is tuple else out[0]
+        if type(result) is tuple:
+            return tuple(self._wrap_result(x) for x in result)
+        return self._wrap_result(result)
+
+    def _parallelizes(self, lhs, rhs) -> bool:
+        if not (isinstance(lhs, np.ndarray) and isinstance(rhs, np.ndarray) and lhs.ndim == rhs.ndim == 2):
+            return False
+        return should_parallelize(self.matmul_jobs, lhs.shape[0], lhs.shape[1], rhs.shape[1],
+                                  self.parallel_min_operations, lhs, rhs)
+
+    def _out_of_core_ufunc(self, ufunc, inputs, out=None, **kwargs):
+        """
+        Streams ufunc over row blocks of memory-mapped operands writing into out,
+        which is a temporary memory-mapped array if not given; matmul goes by tiles.
+        Returns NotImplemented for calls which aren't over 2-D matrices.
+        """
+        out = out[0] if out else None
+        if ufunc is np.matmul:
+            if len(inputs) != 2 or kwargs or any(np.ndim(x) != 2 for x in inputs):
+                return NotImplemented
+            lhs, rhs = inputs
+            if out is None:
+                out = open_temporary_memmap((lhs.shape[0], rhs.shape[1]), np.result_type(lhs, rhs),
+                                            self.out_of_core_dir)
+            return blocked_matmul_out_of_core(lhs, rhs, out, self.out_of_core_block_bytes, self.out_of_core_dir)
+
+        shape = np.broadcast_shapes(*(np.shape(x) for x in inputs))
+        if len(shape) != 2 or ufunc.signature is not None:
+            return NotImplemented
+        rows, cols = shape
+        row_bytes = cols * max(np.dtype(getattr(x, 'dtype', np.float64)).itemsize for x in inputs)
+        block_rows = max(1, self.out_of_core_block_bytes // row_bytes)
+
+        def block(x, start, stop):  # operands broadcast along rows are used as is
+            return x[start:stop] if np.ndim(x) == 2 and np.shape(x)[0] == rows else x
+
+        for start in range(0, rows, block_rows):
+            stop = min(start + block_rows, rows)
+            block_result = ufunc(*(block(x, start, stop) for x in inputs), **kwargs)
+            if out is None:
+                out = open_temporary_memmap(shape, block_result.dtype, self.out_of_core_dir)
+            out[start:stop] = block_result
+        return out
+
+    @classmethod
+    def load(cls, filename: str, format: Optional[str] = None):
+        rows, cols, data = serializers.load(filename, format)
+        return cls(np.asarray(data).reshape(rows, cols))
+
+    @classmethod
+    def from_npy(cls, filename: str, mmap_mode: Optional[str] = "r"):
+        """Opens a .npy file memory-mapped by default, so the matrix isn't loaded into memory."""
+        return cls(np.load(filename, mmap_mode=mmap_mode))
+
+    @classmethod
+    def open_memmap(cls, filename: str, shape: Tuple[int, int], dtype=np.float64, mode: str = "w+"):
+        """Creates (or opens with mode "r+"/"r") a disk-backed matrix stored as a .npy file."""
+        return cls(np.lib.format.open_memmap(filename, mode=mode, dtype=dtype, shape=shape))
 
     def __repr__(self):
-        return '%s(%r)' % (type(self).__name__, self.ndarray_matrix)
+        return '%s(%r)' % (type(self).__name__, self._ndarray)
@@ -0,0 +1,170 @@
+import atexit
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, NoReturn, Optional, Tuple
+
+import numpy as np
+
+from my_matrix import FlatBuffer, blocked_matmul, flat_buffer, packed_int_matmul
+
+# operands are shared with workers as (segment name, typecode or dtype string, shape)
+SharedOperand = Tuple[str, str, Tuple[int, ...]]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_jobs = 0
+
+
+def get_pool(n_jobs: int) -> ProcessPoolExecutor:
+    """Process pool reused by all parallel products, as starting workers costs more than a small product."""
+    global _pool, _pool_jobs
+    if _pool is None or _pool_jobs != n_jobs:
+        shutdown_pool()
+        # forked workers must share the parent's tracker, otherwise they unlink the segments they attach to
+        resource_tracker.ensure_running()
+        _pool, _pool_jobs = ProcessPoolExecutor(max_workers=n_jobs), n_jobs
+    return _pool
+
+
+@atexit.register
+def shutdown_pool() -> NoReturn:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def is_shareable(data: FlatBuffer) -> bool:
+    """Only fixed size numbers have a raw representation, lists of arbitrary precision ints are pickled."""
+    if isinstance(data, np.ndarray):
+        return data.dtype.kind in "iufb"
+    return isinstance(data, array)
+
+
+def row_blocks(rows: int, n_blocks: int) -> List[Tuple[int, int]]:
+    n_blocks = max(1, min(rows, n_blocks))
+    bounds = [rows * k // n_blocks for k in range(n_blocks + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+class SharedBuffers:
+    """Shared memory segments of one product, closed and unlinked on exit from the with block."""
+
+    def __init__(self):
+        self.segments: List[SharedMemory] = []
+
+    def create(self, nbytes: int) -> SharedMemory:
+        segment = SharedMemory(create=True, size=max(1, nbytes))
+        self.segments.append(segment)
+        return segment
+
+    def share_array(self, data: array) -> SharedOperand:
+        segment = self.create(data.itemsize * len(data))
+        segment.buf[:data.itemsize * len(data)] = memoryview(data).cast("B")
+        return segment.name, data.typecode, (len(data),)
+
+    def share_ndarray(self, data: np.ndarray) -> SharedOperand:
+        segment = self.create(data.nbytes)
+        np.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf)[...] = data
+        return segment.name, data.dtype.str, data.shape
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> NoReturn:
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+
+
+def _flat_block_task(lhs: SharedOperand, rhs: SharedOperand, out: SharedOperand, inner: int, cols: int,
+                     row_start: int, row_stop: int, tile_size: int) -> Optional[list]:
+    """
+    Computes result rows [row_start, row_stop) of flat array operands into out, by packed_int_matmul
+    for int64 operands where it applies as the serial product does, by blocked_matmul otherwise.
+    Returns the rows themselves if they don't fit the out typecode, e.g. on int64 overflow.
+    """
+    segments = [SharedMemory(operand[0]) for operand in (lhs, rhs, out)]
+    views = []
+    try:
+        views = [segment.buf.cast(operand[1]) for segment, operand in zip(segments, (lhs, rhs, out))]
+        lhs_view, rhs_view, out_view = views
+        lhs_rows, rhs_rows = lhs_view[row_start * inner:row_stop * inner].tolist(), rhs_view.tolist()
+        block = None
+        if lhs[1] == rhs[1] == "q":
+            block = packed_int_matmul(lhs_rows, rhs_rows, row_stop - row_start, inner, cols)
+        if block is None:
+            block = blocked_matmul(lhs_rows, rhs_rows, row_stop - row_start, inner, cols, tile_size)
+        try:
+            out_view[row_start * cols:row_stop * cols] = array(out[1], block)
+        except (TypeError, OverflowError):
+            return block
+        return None
+    finally:
+        for view in views:
+            view.release()
+        for segment in segments:
+            segment.close()
+
+
+def _ndarray_block_task(lhs: SharedOperand, rhs: SharedOperand, out: SharedOperand,
+                        row_start: int, row_stop: int) -> NoReturn:
+    segments = [SharedMemory(operand[0]) for operand in (lhs, rhs, out)]
+    views = []
+    try:
+        views = [np.ndarray(operand[2], dtype=operand[1], buffer=segment.buf)
+                 for segment, operand in zip(segments, (lhs, rhs, out))]
+        np.matmul(views[0][row_start:row_stop], views[1], out=views[2][row_start:row_stop])
+    finally:
+        views.clear()  # arrays over a segment buffer must be gone before it is closed, even if matmul failed
+        for segment in segments:
+            segment.close()
+
+
+def parallel_flat_matmul(lhs: FlatBuffer, rhs: FlatBuffer, rows: int, inner: int, cols: int,
+                         n_jobs: int, tile_size: int) -> FlatBuffer:
+    """
+    Row-major flat array product computed by row blocks in the process pool,
+    operands and result are passed through shared memory instead of pickling.
+    """
+    typecode = "d" if "d" in (lhs.typecode, rhs.typecode) else "q"
+    blocks = row_blocks(rows, 2 * n_jobs)  # more blocks than workers evens out their load
+    with SharedBuffers() as buffers:
+        lhs_operand, rhs_operand = buffers.share_array(lhs), buffers.share_array(rhs)
+        out_segment = buffers.create(rows * cols * array(typecode).itemsize)
+        out_operand = (out_segment.name, typecode, (rows * cols,))
+        pool = get_pool(n_jobs)
+        futures = [pool.submit(_flat_block_task, lhs_operand, rhs_operand, out_operand, inner, cols,
+                               row_start, row_stop, tile_size) for row_start, row_stop in blocks]
+        overflown = [future.result() for future in futures]
+        result = array(typecode)
+        result.frombytes(out_segment.buf[:rows * cols * result.itemsize])
+        if not any(overflown):
+            return result
+        merged = []
+        for (row_start, row_stop), block in zip(blocks, overflown):
+            merged += block if block is not None else result[row_start * cols:row_stop * cols].tolist()
+        return flat_buffer(merged)
+
+
+def parallel_ndarray_matmul(lhs: np.ndarray, rhs: np.ndarray, n_jobs: int) -> np.ndarray:
+    """2-D NumPy product computed by row blocks in the process pool through shared memory."""
+    shape, dtype = (lhs.shape[0], rhs.shape[1]), np.result_type(lhs, rhs)
+    with SharedBuffers() as buffers:
+        lhs_operand, rhs_operand = buffers.share_ndarray(lhs), buffers.share_ndarray(rhs)
+        out_segment = buffers.create(shape[0] * shape[1] * dtype.itemsize)
+        out_operand = (out_segment.name, dtype.str, shape)
+        pool = get_pool(n_jobs)
+        futures = [pool.submit(_ndarray_block_task, lhs_operand, rhs_operand, out_operand, row_start, row_stop)
+                   for row_start, row_stop in row_blocks(shape[0], 2 * n_jobs)]
+        for future in futures:
+            future.result()
+        return np.ndarray(shape, dtype=dtype, buffer=out_segment.buf).copy()
+
+
+def should_parallelize(n_jobs: int, rows: int, inner: int, cols: int, min_operations: int,
+                       lhs: FlatBuffer, rhs: FlatBuffer) -> bool:
+    """Small products are faster serially than their hand-off to the pool."""
+    return n_jobs > 1 and rows > 1 and rows * inner * cols >= min_operations and \
+        is_shareable(lhs) and is_shareable(rhs) and isinstance(lhs, np.ndarray) == isinstance(rhs, np.ndarray)
@@ -0,0 +1,194 @@
+import bz2
+import gzip
+import lzma
+import os
+import struct
+import zipfile
+from array import array
+from typing import BinaryIO, Callable, Dict, Iterator, NoReturn, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# matrices are passed to formats as (rows, cols, data): data is either a row-major flat buffer
+# (array.array, 1-D ndarray or list) or a 2-D ndarray
+MatrixData = Tuple[int, int, Union[array, np.ndarray, list]]
+
+COMPRESSIONS: Dict[str, Callable[[str, str], BinaryIO]] = {
+    "gz": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+
+
+class SerializationError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+def data_rows(rows: int, cols: int, data) -> Iterator[Sequence]:
+    if isinstance(data, np.ndarray) and data.ndim == 2:
+        return iter(data)
+    return (data[i * cols:(i + 1) * cols] for i in range(rows))
+
+
+def parse_number(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+class TextFormat:
+    """The " | "-separated table written by str(matrix), streamed row by row."""
+    extension = "txt"
+
+    def write(self, file: BinaryIO, rows: int, cols: int, data) -> NoReturn:
+        for index, row in enumerate(data_rows(rows, cols, data)):
+            if index != 0:
+                file.write(b"\n")
+            file.write(" | ".join(map(str, row)).encode())
+
+    def read(self, file: BinaryIO) -> MatrixData:
+        values, rows, cols = [], 0, None
+        for line in file:
+            row = line.decode().strip()
+            if not row:
+                continue
+            row_values = [parse_number(value) for value in row.split(" | ")]
+            if cols is not None and len(row_values) != cols:
+                raise SerializationError(f"row {rows} has {len(row_values)} values instead of {cols}")
+            cols = len(row_values)
+            values += row_values
+            rows += 1
+        return rows, cols or 0, values
+
+
+class NpyFormat:
+    """NumPy .npy: flat buffers are viewed as 2-D arrays without copying where possible."""
+    extension = "npy"
+
+    def write(self, file: BinaryIO, rows: int, cols: int, data) -> NoReturn:
+        if isinstance(data, array):
+            data = np.frombuffer(data, dtype=np.int64 if data.typecode == "q" else np.float64)
+        np.save(file, np.asarray(data).reshape(rows, cols), allow_pickle=False)
+
+    def read(self, file: BinaryIO) -> MatrixData:
+        matrix = np.load(file, allow_pickle=False)
+        if matrix.ndim != 2:
+            raise SerializationError(f"npy array has {matrix.ndim} dims instead of 2")
+        return matrix.shape[0], matrix.shape[1], matrix
+
+
+class BinaryFormat:
+    """
+    Compact MyMatrix format: magic, element type ("q" int64, "d" double or "o" for other numbers),
+    rows and cols, then raw row-major elements; "o" elements are length-prefixed decimal strings,
+    which also keep uint64 values exact.
+    """
+    extension = "mym"
+    magic = b"MYM1"
+    header = struct.Struct("<4sc2Q")
+    length_prefix = struct.Struct("<I")
+
+    def write(self, file: BinaryIO, rows: int, cols: int, data) -> NoReturn:
+        if isinstance(data, np.ndarray):
+            data = data.reshape(-1)
+            typecode = {"i": "q", "u": "q", "b": "q", "f": "d"}.get(data.dtype.kind, "o")
+            if data.dtype.kind == "u" and data.dtype.itemsize == 8:  # values above int64 would wrap
+                typecode = "o"
+            if typecode == "o":
+                data = data.tolist()
+            else:
+                data = np.ascontiguousarray(data, dtype=np.int64 if typecode == "q" else np.float64)
+        else:
+            typecode = data.typecode if isinstance(data, array) else "o"
+
+        file.write(self.header.pack(self.magic, typecode.encode(), rows, cols))
+        if typecode != "o":
+            file.write(data.tobytes() if isinstance(data, np.ndarray) else memoryview(data).cast("B"))
+            return
+        for value in data:
+            if isinstance(value, np.generic):  # repr of NumPy scalars is like np.int64(2)
+                value = value.item()
+            encoded = repr(value).encode()
+            file.write(self.length_prefix.pack(len(encoded)))
+            file.write(encoded)
+
+    def read(self, file: BinaryIO) -> MatrixData:
+        magic, typecode, rows, cols = self.header.unpack(file.read(self.header.size))
+        if magic != self.magic:
+            raise SerializationError(f"bad magic {magic!r}, not a {self.extension} file")
+        typecode = typecode.decode()
+        if typecode != "o":
+            data = array(typecode)
+            data.frombytes(file.read(rows * cols * data.itemsize))
+            if len(data) != rows * cols:
+                raise SerializationError(f"truncated file: {len(data)} of {rows * cols} elements")
+            return rows, cols, data
+        data = []
+        for _ in range(rows * cols):
+            (length,) = self.length_prefix.unpack(file.read(self.length_prefix.size))
+            data.append(parse_number(file.read(length).decode()))
+        return rows, cols, data
+
+
+FORMATS = {serializer.extension: serializer for serializer in (TextFormat(), NpyFormat(), BinaryFormat())}
+
+
+def register_format(serializer) -> NoReturn:
+    """Adds a format object with extension attribute and write(file, rows, cols, data), read(file) methods."""
+    FORMATS[serializer.extension] = serializer
+
+
+def resolve_format(filename: str, format: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """Returns (format, compression) given explicitly as "npy.gz" or taken from the filename like "a.npy.gz"."""
+    parts = (format or os.path.basename(filename)).split(".")
+    compression = parts.pop() if len(parts) > 1 and parts[-1] in COMPRESSIONS else None
+    name = parts[-1]
+    if name not in FORMATS:
+        raise SerializationError(f"unknown format {name!r} of {filename}, known: {sorted(FORMATS)}")
+    return name, compression
+
+
+def _open(filename: str, mode: str, compression: Optional[str]) -> BinaryIO:
+    return COMPRESSIONS[compression](filename, mode) if compression else open(filename, mode)
+
+
+def save(filename: str, rows: int, cols: int, data, format: Optional[str] = None) -> NoReturn:
+    name, compression = resolve_format(filename, format)
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _open(filename, "wb", compression) as file:
+        FORMATS[name].write(file, rows, cols, data)
+
+
+def load(filename: str, format: Optional[str] = None) -> MatrixData:
+    name, compression = resolve_format(filename, format)
+    with _open(filename, "rb", compression) as file:
+        return FORMATS[name].read(file)
+
+
+def save_archive(filename: str, matrices: Dict[str, MatrixData], format: str = "mym",
+                 compression: int = zipfile.ZIP_DEFLATED) -> NoReturn:
+    """Writes many matrices into one zip archive, each as a "<name>.<format>" entry streamed into it."""
+    serializer = FORMATS[resolve_format(filename, format)[0]]
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with zipfile.ZipFile(filename, "w", compression=compression) as archive:
+        for name, (rows, cols, data) in matrices.items():
+            with archive.open(f"{name}.{serializer.extension}", "w", force_zip64=True) as file:
+                serializer.write(file, rows, cols, data)
+
+
+def load_archive(filename: str) -> Dict[str, MatrixData]:
+    matrices = {}
+    with zipfile.ZipFile(filename) as archive:
+        for entry in archive.namelist():
+            name, extension = entry.rsplit(".", 1)
+            with archive.open(entry) as file:
+                matrices[name] = FORMATS[extension].read(file)
+    return matrices
+
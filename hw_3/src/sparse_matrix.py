@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import operator
+from array import array
+from bisect import bisect_left
+from itertools import repeat
+from typing import Callable, Dict, List, NoReturn, Sequence, Tuple
+
+import serializers
+from my_matrix import MyMatrix, AddError, ElementWiseMultiplyError, MathematicalMultiplyError, flat_buffer, \
+    is_lazy, python_buffer
+
+
+class SparseMyMatrix(MyMatrix):
+    """
+    MyMatrix in CSR form: row i holds values[indptr[i]:indptr[i + 1]] at columns indices[indptr[i]:indptr[i + 1]],
+    columns are sorted and zeros aren't stored, so equal matrices have equal CSR arrays.
+    Operators with dense MyMatrix dispatch here first as this is a subclass overriding the reflected ones.
+    """
+    __slots__ = ("indptr", "indices", "values")
+
+    @classmethod
+    def _from_csr(cls, rows: int, cols: int, indptr: array, indices: array, values: Sequence) -> SparseMyMatrix:
+        matrix = cls.__new__(cls)
+        matrix._data = None
+        matrix.rows = rows
+        matrix.cols = cols
+        matrix._elements_hash = None
+        matrix._fingerprint = None
+        matrix.indptr = indptr
+        matrix.indices = indices
+        matrix.values = flat_buffer(values)
+        return matrix
+
+    @classmethod
+    def _from_row_dicts(cls, rows: int, cols: int, row_dicts: List[Dict[int, object]]) -> SparseMyMatrix:
+        indptr, indices, values = array("q", [0]), array("q"), []
+        for row in row_dicts:
+            for j in sorted(row):
+                if row[j]:
+                    indices.append(j)
+                    values.append(row[j])
+            indptr.append(len(indices))
+        return cls._from_csr(rows, cols, indptr, indices, values)
+
+    @classmethod
+    def from_dense(cls, matrix: MyMatrix) -> SparseMyMatrix:
+        data = python_buffer(matrix._data)
+        indptr, indices, values = array("q", [0]), array("q"), []
+        for i in range(matrix.rows):
+            row_start = i * matrix.cols
+            for j, value in enumerate(data[row_start:row_start + matrix.cols]):
+                if value:
+                    indices.append(j)
+                    values.append(value)
+            indptr.append(len(indices))
+        return cls._from_csr(matrix.rows, matrix.cols, indptr, indices, values)
+
+    def __init__(self, matrix):
+        sparse = self.from_dense(matrix if isinstance(matrix, MyMatrix) else MyMatrix(matrix))
+        for slot in ("_data", "rows", "cols", "_elements_hash", "_fingerprint", "indptr", "indices", "values"):
+            setattr(self, slot, getattr(sparse, slot))
+
+    def _row_items(self, i: int) -> Tuple[Sequence, Sequence]:
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:stop], self.values[start:stop]
+
+    def nnz(self) -> int:
+        return len(self.indices)
+
+    def density(self) -> float:
+        return self.nnz() / (self.rows * self.cols)
+
+    def row(self, i: int) -> List:
+        row = [0] * self.cols
+        for j, value in zip(*self._row_items(i)):
+            row[j] = value
+        return row
+
+    def to_dense(self) -> MyMatrix:
+        data = [0] * (self.rows * self.cols)
+        for i in range(self.rows):
+            row_start = i * self.cols
+            for j, value in zip(*self._row_items(i)):
+                data[row_start + j] = value
+        return MyMatrix._from_flat(flat_buffer(data), self.rows, self.cols)
+
+    @property
+    def matrix_data(self) -> serializers.MatrixData:
+        return self.to_dense().matrix_data
+
+    @classmethod
+    def from_data(cls, rows: int, cols: int, data) -> SparseMyMatrix:
+        return cls.from_dense(MyMatrix.from_data(rows, cols, data))
+
+    def _elements_sum(self):
+        return sum(self.values)
+
+    def __hash__(self) -> int:
+        return super().__hash__()
+
+    def __eq__(self, other) -> bool:
+        if self.rows != other.rows or self.cols != other.cols:
+            return False
+        if isinstance(other, SparseMyMatrix):
+            return self.indptr == other.indptr and self.indices == other.indices and \
+                list(self.values) == list(other.values)
+        return self.to_dense() == other
+
+    def _position(self, key: Tuple[int, int]) -> Tuple[int, bool]:
+        """Returns the CSR position of element key and whether it is stored."""
+        i, j = key
+        self._index(key)  # checks bounds
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        position = bisect_left(self.indices, j, start, stop)
+        return position, position < stop and self.indices[position] == j
+
+    def __getitem__(self, key: Tuple[int, int]):
+        position, stored = self._position(key)
+        return self.values[position] if stored else 0
+
+    def __setitem__(self, key: Tuple[int, int], value) -> NoReturn:
+        position, stored = self._position(key)
+        old_value = self.values[position] if stored else 0
+        values = list(self.values)
+        if stored and value:
+            values[position] = value
+        elif stored:
+            del values[position]
+            del self.indices[position]
+        elif value:
+            values.insert(position, value)
+            self.indices.insert(position, key[1])
+        for i in range(key[0] + 1, self.rows + 1):
+            self.indptr[i] += len(values) - len(self.values)
+        self.values = flat_buffer(values)
+        self._update_elements_hash(old_value, value)
+        self._fingerprint = None
+
+    def _merge(self, other: SparseMyMatrix, op: Callable, union: bool) -> SparseMyMatrix:
+        row_dicts = []
+        for i in range(self.rows):
+            lhs = dict(zip(*self._row_items(i)))
+            rhs = dict(zip(*other._row_items(i)))
+            columns = lhs.keys() | rhs.keys() if union else lhs.keys() & rhs.keys()
+            row_dicts.append({j: op(lhs.get(j, 0), rhs.get(j, 0)) for j in columns})
+        return SparseMyMatrix._from_row_dicts(self.rows, self.cols, row_dicts)
+
+    def __add__(self, other) -> MyMatrix:  # +
+        if not isinstance(other, MyMatrix):
+            if is_lazy(other):
+                return NotImplemented  # LazyMatrix builds the node
+            raise AddError(f"rhs must be MyMatrix, not {type(other)} object")
+        if self.cols != other.cols or self.rows != other.rows:
+            raise AddError(f"bad dimensions, ({self.cols}, {self.rows}) != ({other.cols}, {other.rows})")
+        if isinstance(other, SparseMyMatrix):
+            return self._merge(other, operator.add, union=True)
+        return self.to_dense() + other
+
+    __radd__ = __add__
+
+    def __mul__(self, other) -> MyMatrix:  # *
+        if not isinstance(other, MyMatrix):
+            if is_lazy(other):
+                return NotImplemented  # LazyMatrix builds the node
+            raise ElementWiseMultiplyError(f"rhs must be MyMatrix, not {type(other)} object")
+        if self.cols != other.cols or self.rows != other.rows:
+            raise ElementWiseMultiplyError(
+                f"bad dimensions, ({self.cols}, {self.rows}) != ({other.cols}, {other.rows})")
+        if isinstance(other, SparseMyMatrix):
+            return self._merge(other, operator.mul, union=False)
+        # zeros of self stay zeros, so the product is as sparse as self
+        row_dicts = []
+        for i in range(self.rows):
+            indices, values = self._row_items(i)
+            row_dicts.append({j: value * other[i, j] for j, value in zip(indices, values)})
+        return SparseMyMatrix._from_row_dicts(self.rows, self.cols, row_dicts)
+
+    __rmul__ = __mul__
+
+    def __matmul__(self, other) -> MyMatrix:  # @
+        if not isinstance(other, MyMatrix):
+            if is_lazy(other):
+                return NotImplemented  # LazyMatrix builds the node
+            raise MathematicalMultiplyError(f"rhs must be MyMatrix, not {type(other)} object")
+        if self.cols != other.rows:
+            raise MathematicalMultiplyError(f"bad dimensions, lhs.cols ({self.cols}) != rhs.rows ({other.rows})")
+        if isinstance(other, SparseMyMatrix):
+            return self._matmul_sparse(other)
+        return self._matmul_dense(other)
+
+    def __rmatmul__(self, other) -> MyMatrix:  # dense @ sparse
+        if not isinstance(other, MyMatrix):
+            return NotImplemented
+        if other.cols != self.rows:
+            raise MathematicalMultiplyError(f"bad dimensions, lhs.cols ({other.cols}) != rhs.rows ({self.rows})")
+        lhs = python_buffer(other._data)
+        result = [0] * (other.rows * self.cols)
+        for i in range(other.rows):
+            result_start = i * self.cols
+            for k, lhs_value in enumerate(lhs[i * other.cols:(i + 1) * other.cols]):
+                if lhs_value:
+                    for j, value in zip(*self._row_items(k)):
+                        result[result_start + j] += lhs_value * value
+        return MyMatrix._from_flat(flat_buffer(result), other.rows, self.cols)
+
+    def _matmul_dense(self, other: MyMatrix) -> MyMatrix:
+        """Each result row is a combination of the rhs rows selected by the nonzeros of the lhs row."""
+        rhs = python_buffer(other._data)
+        cols = other.cols
+        result = []
+        for i in range(self.rows):
+            row = [0] * cols
+            for k, value in zip(*self._row_items(i)):
+                row = list(map(operator.add, row, map(operator.mul, repeat(value), rhs[k * cols:(k + 1) * cols])))
+            result += row
+        return MyMatrix._from_flat(flat_buffer(result), self.rows, cols)
+
+    def _matmul_sparse(self, other: SparseMyMatrix) -> SparseMyMatrix:
+        """Gustavson's algorithm: work is proportional to the number of multiplied nonzero pairs."""
+        row_dicts = []
+        for i in range(self.rows):
+            row = {}
+            for k, lhs_value in zip(*self._row_items(i)):
+                for j, rhs_value in zip(*other._row_items(k)):
+                    row[j] = row.get(j, 0) + lhs_value * rhs_value
+            row_dicts.append(row)
+        return SparseMyMatrix._from_row_dicts(self.rows, other.cols, row_dicts)
+
+    def __repr__(self) -> str:
+        return f"SparseMyMatrix({self.rows}x{self.cols}, nnz={self.nnz()})"
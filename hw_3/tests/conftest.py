@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of hw_3 import each other as top-level modules, the way src/main.py is run
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
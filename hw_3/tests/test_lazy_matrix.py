@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from my_matrix import MyMatrix
+
+
+@pytest.mark.parametrize("make", [lambda rows: rows, np.array], ids=["list", "ndarray"])
+def test_long_fused_chain(make):
+    a, b = MyMatrix(make([[1, 2], [3, 4]])), MyMatrix(make([[5, 6], [7, 8]]))
+    expression, expected = a.lazy(), a
+    for _ in range(1000):
+        expression, expected = expression + b, expected + b
+
+    assert expression.compute() == expected
+
+
+def test_shared_subexpression():
+    a, b = MyMatrix([[1, 2], [3, 4]]), MyMatrix([[5, 6], [7, 8]])
+    shared = a.lazy() + b
+    assert (shared * shared + shared).compute() == (a + b) * (a + b) + (a + b)
+
+
+def test_dense_lhs_with_lazy_rhs():
+    a, b = MyMatrix([[1, 2], [3, 4]]), MyMatrix([[5, 6], [7, 8]])
+    assert (a + b.lazy()).compute() == a + b
+    assert (a * b.lazy()).compute() == a * b
+    assert (a @ b.lazy() @ a).compute() == a @ b @ a
@@ -0,0 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from matmul_cache import MatmulCache, use_matmul_cache
+from my_matrix import MyMatrix
+
+
+def test_shared_cache_stays_consistent_across_threads():
+    matrices = [MyMatrix([[i, 1], [2, i]]) for i in range(8)]
+    cache = MatmulCache(max_entries=4)
+
+    def multiply(index: int) -> bool:
+        lhs, rhs = matrices[index % 8], matrices[index * 3 % 8]
+        with use_matmul_cache(cache):
+            return lhs @ rhs == lhs._matmul(rhs)
+
+    with ThreadPoolExecutor(8) as executor:
+        assert all(executor.map(multiply, range(2000)))
+    assert len(cache) <= 4
+    assert cache.size_bytes == sum(entry[3] for entry in cache._entries.values())
+    assert cache.hits + cache.misses == 2000
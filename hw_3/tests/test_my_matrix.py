@@ -0,0 +1,31 @@
+from array import array
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+
+from my_matrix import MyMatrix, flat_buffer
+
+
+def test_int64_overflow_keeps_python_ints():
+    matrix = MyMatrix([[1, 2 ** 62], [3, 4]])
+    assert (matrix + matrix).matrix == [[2, 2 ** 63], [6, 8]]
+    assert (matrix * matrix).matrix == [[1, 2 ** 124], [9, 16]]
+
+
+@pytest.mark.parametrize("values", [
+    [0.5, Fraction(1, 3)],
+    [Fraction(1, 3), 0.5],
+    [0.5, Decimal("0.1")],
+    [0.5, 2 ** 53 + 1],
+    [2 ** 53 + 1, 0.5],
+])
+def test_flat_buffer_keeps_inexact_doubles_in_list(values):
+    buffer = flat_buffer(values)
+    assert isinstance(buffer, list) and buffer == values
+    assert isinstance(flat_buffer(values, "d"), list)
+
+
+def test_flat_buffer_packs_exact_doubles():
+    assert flat_buffer([0.5, 2 ** 53, -3]) == array("d", [0.5, 2 ** 53, -3])
+    assert flat_buffer([1, 2]) == array("q", [1, 2])
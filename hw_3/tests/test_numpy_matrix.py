@@ -0,0 +1,17 @@
+import numpy as np
+
+from numpy_matrix import NumpyMatrix
+
+
+def test_in_place_out_of_core_matmul_spanning_several_tiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(NumpyMatrix, "out_of_core_block_bytes", 96)
+    random = np.random.RandomState(0)
+    lhs, rhs = random.randint(0, 9, (6, 6)), random.randint(0, 9, (6, 6))
+    matrix_a = NumpyMatrix.open_memmap(str(tmp_path / "a.npy"), lhs.shape, dtype=lhs.dtype)
+    matrix_a.matrix[...] = lhs
+    matrix_b = NumpyMatrix.open_memmap(str(tmp_path / "b.npy"), rhs.shape, dtype=rhs.dtype)
+    matrix_b.matrix[...] = rhs
+
+    matrix_a @= matrix_b
+
+    assert np.array_equal(np.asarray(matrix_a.matrix), lhs @ rhs)
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from my_matrix import MyMatrix
+from parallel_matmul import SharedBuffers, _ndarray_block_task
+
+
+def test_parallel_int_product_matches_serial(monkeypatch):
+    random = np.random.RandomState(0)
+    lhs, rhs = (MyMatrix(random.randint(-50, 50, (40, 40)).tolist()) for _ in range(2))
+    serial = lhs._matmul(rhs)
+
+    monkeypatch.setattr(MyMatrix, "matmul_jobs", 2)
+    monkeypatch.setattr(MyMatrix, "parallel_min_operations", 1)
+    assert lhs._matmul(rhs) == serial
+
+
+def test_ndarray_block_task_failure_releases_segments():
+    with SharedBuffers() as buffers:
+        lhs, rhs, out = (buffers.share_ndarray(np.ones((2, 3))) for _ in range(3))
+        with pytest.raises(ValueError):
+            _ndarray_block_task(lhs, rhs, out, 0, 2)
@@ -0,0 +1,15 @@
+import numpy as np
+
+import serializers
+
+
+def test_binary_format_writes_numpy_scalars_as_numbers(tmp_path):
+    filename = str(tmp_path / "scalars.mym")
+    serializers.save(filename, 1, 3, [np.int64(2), np.float64(0.5), 7])
+    assert serializers.load(filename) == (1, 3, [2, 0.5, 7])
+
+
+def test_binary_format_keeps_uint64_exact(tmp_path):
+    filename = str(tmp_path / "uint64.mym")
+    serializers.save(filename, 1, 2, np.array([[2 ** 64 - 1, 1]], dtype=np.uint64))
+    assert list(serializers.load(filename)[2]) == [2 ** 64 - 1, 1]
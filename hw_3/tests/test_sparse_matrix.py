@@ -0,0 +1,23 @@
+import pytest
+
+from my_matrix import MyMatrix
+from sparse_matrix import SparseMyMatrix
+
+
+@pytest.mark.parametrize("extension", ["txt", "npy", "mym", "mym.gz"])
+def test_save_load_round_trip(tmp_path, extension):
+    sparse = SparseMyMatrix([[1, 0, 0], [0, 0, 2.5]])
+    filename = str(tmp_path / f"sparse.{extension}")
+
+    sparse.save(filename)
+
+    assert MyMatrix.load(filename) == sparse.to_dense()
+    loaded = SparseMyMatrix.load(filename)
+    assert isinstance(loaded, SparseMyMatrix) and loaded == sparse
+
+
+def test_write_to_file(tmp_path):
+    filename = str(tmp_path / "sparse.txt")
+    SparseMyMatrix([[1, 0], [0, 2]]).write_to_file(filename)
+    with open(filename) as file:
+        assert file.read() == "1 | 0\n0 | 2"
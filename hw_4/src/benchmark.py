@@ -0,0 +1,174 @@
+import csv
+import json
+import math
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, NoReturn, Optional, TextIO
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+CSV_FIELDS = ("name", "runs", "min_s", "median_s", "p95_s", "stddev_s", "wall_s", "cpu_s", "rss_high_water_kb")
+
+
+class BenchmarkError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class BenchmarkRegressionError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+def _cpu_time_s() -> float:
+    """User and system time of this process and its waited children, so process pools are counted too."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _rss_high_water_kb() -> Optional[int]:
+    """Largest resident set size so far of this process or any of its waited children."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, kilobytes elsewhere
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    runs_ns: List[int] = field(default_factory=list)
+    cpu_s: float = 0.0
+    # peak resident set size of the process which ran the benchmark and its workers, see benchmark
+    rss_high_water_kb: Optional[int] = None
+
+    @property
+    def min_s(self) -> float:
+        return min(self.runs_ns) / 1e9
+
+    @property
+    def median_s(self) -> float:
+        return statistics.median(self.runs_ns) / 1e9
+
+    @property
+    def p95_s(self) -> float:
+        ordered = sorted(self.runs_ns)
+        return ordered[math.ceil(0.95 * len(ordered)) - 1] / 1e9
+
+    @property
+    def stddev_s(self) -> float:
+        return statistics.stdev(self.runs_ns) / 1e9 if len(self.runs_ns) > 1 else 0.0
+
+    @property
+    def wall_s(self) -> float:
+        return sum(self.runs_ns) / 1e9
+
+    def summary(self) -> Dict[str, object]:
+        return {"name": self.name, "runs": len(self.runs_ns), "min_s": self.min_s, "median_s": self.median_s,
+                "p95_s": self.p95_s, "stddev_s": self.stddev_s, "wall_s": self.wall_s, "cpu_s": self.cpu_s,
+                "rss_high_water_kb": self.rss_high_water_kb}
+
+    def __str__(self) -> str:
+        if len(self.runs_ns) == 1:
+            return f"{self.name}: {self.median_s:.4f}s"
+        return f"{self.name}: median {self.median_s:.4f}s, min {self.min_s:.4f}s, p95 {self.p95_s:.4f}s, " \
+               f"stddev {self.stddev_s:.4f}s, cpu/wall {self.cpu_s / self.wall_s:.2f} over {len(self.runs_ns)} runs"
+
+
+def _run(callable_task: Callable[[], NoReturn], name: str, warmup: int, repeat: int) -> BenchmarkResult:
+    for _ in range(warmup):
+        callable_task()
+
+    result = BenchmarkResult(name)
+    cpu_start = _cpu_time_s()
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        callable_task()
+        result.runs_ns.append(time.perf_counter_ns() - start)
+    result.cpu_s = _cpu_time_s() - cpu_start
+    result.rss_high_water_kb = _rss_high_water_kb()
+    return result
+
+
+def _run_and_send(connection, callable_task: Callable[[], NoReturn], name: str, warmup: int, repeat: int) \
+        -> NoReturn:
+    try:
+        connection.send(("result", _run(callable_task, name, warmup, repeat)))
+    except BaseException:
+        connection.send(("error", traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+def benchmark(callable_task: Callable[[], NoReturn], name: str, warmup: int = 1, repeat: int = 5) \
+        -> BenchmarkResult:
+    """
+    Times repeat runs after warmup ones. Where processes can be forked, they run in a fresh child:
+    the resident set size high-water mark never decreases, so measured in this process it would be
+    the peak of the most memory hungry benchmark so far instead of this one's.
+    """
+    if resource is None or "fork" not in multiprocessing.get_all_start_methods():
+        return _run(callable_task, name, warmup, repeat)
+
+    context = multiprocessing.get_context("fork")  # the task may be a closure, which can't be pickled
+    receiver, sender = context.Pipe(duplex=False)
+    child = context.Process(target=_run_and_send, args=(sender, callable_task, name, warmup, repeat))
+    child.start()
+    sender.close()
+    try:
+        status, payload = receiver.recv()
+    except EOFError:
+        status, payload = "error", "the benchmark process exited without a result"
+    finally:
+        receiver.close()
+        child.join()
+    if status == "error":
+        raise BenchmarkError(f"{name} failed:\n{payload}")
+    return payload
+
+
+def write_json(results: Iterable[BenchmarkResult], file: TextIO) -> NoReturn:
+    json.dump([dict(result.summary(), runs_ns=result.runs_ns) for result in results], file, indent=2)
+
+
+def write_csv(results: Iterable[BenchmarkResult], file: TextIO) -> NoReturn:
+    writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    writer.writerows(result.summary() for result in results)
+
+
+def load_results(file: TextIO) -> List[BenchmarkResult]:
+    return [BenchmarkResult(entry["name"], entry["runs_ns"], entry["cpu_s"], entry["rss_high_water_kb"])
+            for entry in json.load(file)]
+
+
+def compare_to_baseline(results: Iterable[BenchmarkResult], baseline: Iterable[BenchmarkResult],
+                        tolerance: float = 0.1) -> List[str]:
+    """Returns descriptions of results whose median is slower than the baseline one by more than tolerance."""
+    baseline_medians = {result.name: result.median_s for result in baseline}
+    regressions = []
+    for result in results:
+        baseline_median = baseline_medians.get(result.name, None)
+        if baseline_median is not None and result.median_s > baseline_median * (1 + tolerance):
+            regressions.append(f"{result.name}: median {result.median_s:.4f}s, baseline {baseline_median:.4f}s")
+    return regressions
+
+
+def check_regressions(results: Iterable[BenchmarkResult], baseline_filename: str, tolerance: float = 0.1) \
+        -> NoReturn:
+    with open(baseline_filename) as baseline_file:
+        regressions = compare_to_baseline(results, load_results(baseline_file), tolerance)
+    if regressions:
+        raise BenchmarkRegressionError(f"{len(regressions)} regressions against {baseline_filename}:\n"
+                                       + "\n".join(regressions))
@@ -1,9 +1,10 @@
 import os
 from multiprocessing import Process
 from threading import Thread
-from typing import NoReturn
+from typing import NoReturn, Optional
 
-from hw_1.src.fibs_ast_drawer.main import gen_fibs
+from hw_1.src.fibs_ast_drawer.fibs import gen_fibs
+from hw_4.src.fibs_cache import FibsCache, SharedFibsCache
 from hw_4.src.utils import measure
 
 FIBS_N = 40_000
@@ -16,21 +17,24 @@ def write_to_file(filename: str, content: str) -> NoReturn:
         file.write(content)
 
 
-def synchronous_task() -> NoReturn:
+def synchronous_task(cache: Optional[FibsCache] = None) -> NoReturn:
+    compute = gen_fibs if cache is None else cache.get
     for _ in range(FIBS_ITERATIONS):
-        gen_fibs(FIBS_N)
+        compute(FIBS_N)
 
 
-def threads_task(threads_cnt: int) -> NoReturn:
-    threads = [Thread(target=gen_fibs, args=(FIBS_N,)) for _ in range(threads_cnt)]
+def threads_task(threads_cnt: int, cache: Optional[FibsCache] = None) -> NoReturn:
+    compute = gen_fibs if cache is None else cache.get
+    threads = [Thread(target=compute, args=(FIBS_N,)) for _ in range(threads_cnt)]
     for thread in threads:
         thread.start()
     for thread in threads:
         thread.join()
 
 
-def multiprocessing_task(processes_cnt: int) -> NoReturn:
-    processes = [Process(target=gen_fibs, args=(FIBS_N,)) for _ in range(processes_cnt)]
+def multiprocessing_task(processes_cnt: int, cache: Optional[SharedFibsCache] = None) -> NoReturn:
+    compute = gen_fibs if cache is None else cache.get
+    processes = [Process(target=compute, args=(FIBS_N,)) for _ in range(processes_cnt)]
     for process in processes:
         process.start()
     for process in processes:
@@ -38,12 +42,21 @@ def multiprocessing_task(processes_cnt: int) -> NoReturn:
 
 
 if __name__ == '__main__':
+    threads_cache = FibsCache()
+    processes_cache = SharedFibsCache()
     tasks = [
         (synchronous_task, "synchronous"),
         (lambda: threads_task(FIBS_ITERATIONS), f"threading with {FIBS_ITERATIONS} threads"),
-        (lambda: multiprocessing_task(FIBS_ITERATIONS), f"multiprocessing with {FIBS_ITERATIONS} processes")
+        (lambda: multiprocessing_task(FIBS_ITERATIONS), f"multiprocessing with {FIBS_ITERATIONS} processes"),
+        (lambda: synchronous_task(threads_cache), "synchronous with cache"),
+        (lambda: threads_task(FIBS_ITERATIONS, threads_cache), f"threading with {FIBS_ITERATIONS} threads and cache"),
+        (lambda: multiprocessing_task(FIBS_ITERATIONS, processes_cache),
+         f"multiprocessing with {FIBS_ITERATIONS} processes and shared memory cache")
     ]
-    res = "\n".join(map(lambda task: measure(*task), tasks))
+    try:
+        res = "\n".join(map(lambda task: measure(*task), tasks))
+    finally:
+        processes_cache.unlink(FIBS_N)
 
     title = f"Run gen_fibs({FIBS_N}) for {FIBS_ITERATIONS} iterations.\n\n"
     write_to_file("../artifacts/easy/fibs.txt", title + res)
@@ -0,0 +1,115 @@
+import io
+import os
+import struct
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import Lock as ProcessLock, Value
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+from typing import Callable, Dict, List
+
+from hw_1.src.fibs_ast_drawer.fibs import gen_fibs, write_fibs, read_fibs
+from hw_4.src.resource_tracking import share_resource_tracker
+
+# shared memory segments may be rounded up to the page size, so the payload length goes first
+PAYLOAD_HEADER = struct.Struct("<Q")
+
+
+class FibsCache:
+    """
+    LRU cache of gen_fibs results shared by the threads of one process.
+    Concurrent requests for the same n are coalesced: one thread computes, the others wait for its result.
+    Every caller gets its own shallow copy of the cached list, so mutating it doesn't affect the others.
+    """
+
+    def __init__(self, compute: Callable[[int], List[int]] = gen_fibs, max_entries: int = 4):
+        self.compute = compute
+        self.max_entries = max_entries
+        self.computations = 0
+        self._lock = Lock()
+        self._entries: OrderedDict[int, List[int]] = OrderedDict()
+        self._pending: Dict[int, Future] = {}
+
+    def get(self, n: int) -> List[int]:
+        with self._lock:
+            if n in self._entries:
+                self._entries.move_to_end(n)
+                return list(self._entries[n])
+            future = self._pending.get(n, None)
+            is_owner = future is None
+            if is_owner:
+                future = self._pending[n] = Future()
+        if not is_owner:
+            return list(future.result())
+
+        try:
+            fibs = self.compute(n)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[n]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.computations += 1
+            self._entries[n] = fibs
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            del self._pending[n]
+        future.set_result(fibs)
+        return list(fibs)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedFibsCache:
+    """
+    gen_fibs results shared by processes through one shared memory segment per n holding the serialized sequence.
+    The first process to request n computes it under a process lock while the others wait and then read it.
+    Segments live until unlink is called, which is the owner's (usually the parent process) responsibility.
+    """
+
+    def __init__(self, compute: Callable[[int], List[int]] = gen_fibs):
+        self.compute = compute
+        self.computations = Value("i", 0)
+        self._lock = ProcessLock()
+        self._prefix = f"fibs_{os.getpid()}_{id(self) % 10_000}"
+        share_resource_tracker()
+
+    def _segment_name(self, n: int) -> str:
+        return f"{self._prefix}_{n}"
+
+    def get(self, n: int) -> List[int]:
+        with self._lock:
+            try:
+                segment = SharedMemory(self._segment_name(n))
+            except FileNotFoundError:
+                segment = self._create_segment(n)
+        try:
+            (length,) = PAYLOAD_HEADER.unpack_from(segment.buf)
+            payload = bytes(segment.buf[PAYLOAD_HEADER.size:PAYLOAD_HEADER.size + length])
+        finally:
+            segment.close()
+        return list(read_fibs(io.BytesIO(payload)))
+
+    def _create_segment(self, n: int) -> SharedMemory:
+        payload = io.BytesIO()
+        write_fibs(payload, self.compute(n))
+        data = payload.getbuffer()
+
+        segment = SharedMemory(self._segment_name(n), create=True, size=PAYLOAD_HEADER.size + len(data))
+        PAYLOAD_HEADER.pack_into(segment.buf, 0, len(data))
+        segment.buf[PAYLOAD_HEADER.size:PAYLOAD_HEADER.size + len(data)] = data
+        del data
+        with self.computations.get_lock():
+            self.computations.value += 1
+        return segment
+
+    def unlink(self, n: int):
+        try:
+            segment = SharedMemory(self._segment_name(n))
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
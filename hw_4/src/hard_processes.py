@@ -1,121 +1,149 @@
+import asyncio
 import codecs
-import time
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from multiprocessing import Process, Queue, Value, Pipe, Condition, Lock
-from multiprocessing.connection import Connection
-from threading import Thread
+from typing import BinaryIO, List, NoReturn, Tuple
+
+from hw_4.src.pipeline import Pipeline, PipelineError, Stage, TokenBucket
 
 STOP_LINE = "stop"
 PROCESS_A_DELAY_SECS = 5
+PROCESS_A_WORKERS = 4
+# links between single processes go through shared memory rings of this size
+RING_CAPACITY = 1 << 16
 
+READ_CHUNK_SIZE = 1 << 16
+FLUSH_INTERVAL_SECS = 0.05
 
-def a_task(stdin_queue: Queue, stdin_queue_condition: Condition, exiting: Value, ab_conn: Connection, ab_condition: Condition):
-    while not exiting.value:
-        stdin_queue_condition.acquire()
-        stdin_queue_condition.wait_for(lambda: exiting.value or not stdin_queue.empty())
-        stdin_queue_condition.release()
-        if exiting.value:
-            break
-        message = stdin_queue.get()
-        lowered_message = message.lower()
 
-        ab_conn.send(lowered_message)
-        ab_condition.acquire()
-        ab_condition.notify()
-        ab_condition.release()
+def a_task(message: str) -> str:
+    return message.lower()
 
-        time.sleep(PROCESS_A_DELAY_SECS)
 
-    while not stdin_queue.empty():
-        stdin_queue.get()
+def b_task(message: str) -> str:
+    return codecs.encode(message, "rot_13")
 
 
-def b_task(exiting: Value, ab_conn: Connection, ab_condition: Condition, out_conn: Connection,
-           out_condition: Condition):
-    while not exiting.value:
-        ab_condition.acquire()
-        ab_condition.wait_for(lambda: exiting.value or ab_conn.poll())
-        ab_condition.release()
-        if exiting.value:
-            return
-        message = ab_conn.recv()
-        encoded_message = codecs.encode(message, "rot_13")
+class OutputBuffer:
+    """Lines tagged with their source, written together on flush with the time formatted once per flush."""
 
-        out_conn.send(encoded_message)
-        out_condition.acquire()
-        out_condition.notify()
-        out_condition.release()
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.chunks: List[Tuple[List[str], str]] = []
 
+    def add(self, lines: List[str], source: str) -> NoReturn:
+        if lines:
+            self.chunks.append((lines, source))
 
-def stdin_task(stdin_queue: Queue, stdin_queue_condition: Condition):
-    while True:
-        line = input()
-        print(line + " < stdin " + datetime.now().strftime("%H:%M:%S"))
-        if line == STOP_LINE:
+    def flush(self) -> NoReturn:
+        if not self.chunks:
             return
-        stdin_queue.put(line)
-        stdin_queue_condition.acquire()
-        stdin_queue_condition.notify()
-        stdin_queue_condition.release()
-
-
-def stdout_task(exiting: Value, out_conn: Connection, out_condition: Condition):
-    while not exiting.value:
-        out_condition.acquire()
-        out_condition.wait_for(lambda: exiting.value or out_conn.poll())
-        out_condition.release()
-        if exiting.value:
-            return
-        message = out_conn.recv()
-        print(message + " < stdout " + datetime.now().strftime("%H:%M:%S"))
-
-
-def main():
-    stdin_queue = Queue()
-    stdin_queue_condition = Condition(Lock())
-    exiting = Value('i', False)
-
-    parent_ab_conn, child_ab_conn = Pipe()
-    ab_condition = Condition(Lock())
-
-    parent_out_conn, child_out_conn = Pipe()
-    out_condition = Condition(Lock())
+        now = datetime.now().strftime("%H:%M:%S")
+        parts = []
+        for lines, source in self.chunks:
+            suffix = f" < {source} {now}\n"
+            parts.append(suffix.join(lines) + suffix)
+        self.chunks.clear()
+        self.stream.write("".join(parts).encode())
+        self.stream.flush()
 
-    process_a = Process(target=a_task, args=(stdin_queue, stdin_queue_condition, exiting, parent_ab_conn, ab_condition))
-    process_b = Process(target=b_task, args=(exiting, child_ab_conn, ab_condition, parent_out_conn, out_condition))
 
-    stdin_thread = Thread(target=stdin_task, args=(stdin_queue, stdin_queue_condition))
-    stdout_thread = Thread(target=stdout_task, args=(exiting, child_out_conn, out_condition))
-
-    # start processes, THEN! local threads
-    process_a.start()
-    process_b.start()
-
-    stdin_thread.start()
-    stdout_thread.start()
-
-    # wait for STOP_LINE
-    stdin_thread.join()
-    exiting.value = True
-
-    # wake up all waiting
-    stdin_queue_condition.acquire()
-    stdin_queue_condition.notify()
-    stdin_queue_condition.release()
-
-    ab_condition.acquire()
-    ab_condition.notify()
-    ab_condition.release()
-
-    out_condition.acquire()
-    out_condition.notify()
-    out_condition.release()
+async def flush_periodically(output: OutputBuffer) -> NoReturn:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECS)
+        output.flush()
+
+
+async def feed_from_file(reader: asyncio.StreamReader, stream: BinaryIO) -> NoReturn:
+    loop = asyncio.get_running_loop()
+    while chunk := await loop.run_in_executor(None, stream.read1, READ_CHUNK_SIZE):
+        reader.feed_data(chunk)
+    reader.feed_eof()
+
+
+async def read_lines(reader: asyncio.StreamReader):
+    """
+    Yields lists of all complete lines available in the input at once, the last one may be unterminated.
+    Lines end with "\n" or "\r\n", neither is part of the yielded line.
+    """
+    rest = b""
+    while chunk := await reader.read(READ_CHUNK_SIZE):
+        data = rest + chunk
+        end = data.rfind(b"\n")
+        if end == -1:
+            rest = data
+            continue
+        rest = data[end + 1:]
+        yield data[:end + 1].replace(b"\r\n", b"\n").decode()[:-1].split("\n")
+    if rest:
+        yield [rest.removesuffix(b"\r").decode()]
+
+
+async def forward_results(pipeline: Pipeline, output: OutputBuffer, executor: ThreadPoolExecutor) -> NoReturn:
+    loop = asyncio.get_running_loop()
+    batches = pipeline.batches()
+    while (batch := await loop.run_in_executor(executor, next, batches, None)) is not None:
+        output.add(batch, "stdout")
+
+
+async def drive(pipeline: Pipeline, input_stream: BinaryIO, output_stream: BinaryIO) -> NoReturn:
+    """
+    Feeds input lines to the started pipeline until STOP_LINE, which drops not yet handled ones, or the end
+    of input, after which all of them are handled. Input is read in bulk and handed to the pipeline
+    by a thread, results come back in batches, and both are echoed through the output buffer.
+    If a stage fails, the rest of the input is dropped too and PipelineError is raised once the pipeline stopped.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    feeder = None
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), input_stream)
+    except ValueError:  # regular files can't be watched by the event loop
+        feeder = asyncio.create_task(feed_from_file(reader, input_stream))
+
+    output = OutputBuffer(output_stream)
+    flusher = asyncio.create_task(flush_periodically(output))
+    # one thread each, so puts keep the input order and the results are read by one consumer
+    with ThreadPoolExecutor(1) as put_executor, ThreadPoolExecutor(1) as get_executor:
+        results = asyncio.create_task(forward_results(pipeline, output, get_executor))
+        stopped = False
+        async for lines in read_lines(reader):
+            if STOP_LINE in lines:
+                lines, stopped = lines[:lines.index(STOP_LINE) + 1], True
+            output.add(lines, "stdin")
+            if stopped:
+                await loop.run_in_executor(put_executor, pipeline.put_many, lines[:-1])
+                break
+            await loop.run_in_executor(put_executor, pipeline.put_many, lines)
+            if pipeline.cancelled.is_set():  # a stage has failed
+                stopped = True
+                break
+
+        await loop.run_in_executor(put_executor, pipeline.cancel if stopped else pipeline.close)
+        try:
+            await results
+        finally:
+            await loop.run_in_executor(None, pipeline.join)
+            flusher.cancel()
+            if feeder is not None:
+                feeder.cancel()
+            output.flush()
 
-    # join processes, then left local threads
-    process_a.join()
-    process_b.join()
 
-    stdout_thread.join()
+def main():
+    # each of process A workers handles a message once per PROCESS_A_DELAY_SECS on average,
+    # so a burst of up to PROCESS_A_WORKERS messages goes through at once; output keeps the input order
+    rate_limiter = TokenBucket(rate=PROCESS_A_WORKERS / PROCESS_A_DELAY_SECS, capacity=PROCESS_A_WORKERS)
+    pipeline = Pipeline([Stage(a_task, workers=PROCESS_A_WORKERS, rate_limiter=rate_limiter), Stage(b_task)],
+                        ring_capacity=RING_CAPACITY)
+
+    # start processes, THEN! the event loop
+    pipeline.start()
+    try:
+        asyncio.run(drive(pipeline, sys.stdin.buffer, sys.stdout.buffer))
+    except PipelineError as error:
+        sys.exit(error.message)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+from typing import Dict, Iterable, NoReturn
+
+from hw_4.src.benchmark import BenchmarkRegressionError
+
+# gen_fibs is imported by every benchmark task and worker, so its module must stay cheap to import:
+# most of the budget is typing and the rest of the standard library it pulls in
+GEN_FIBS_MODULE = "hw_1.src.fibs_ast_drawer.fibs"
+GEN_FIBS_IMPORT_BUDGET_US = 50_000
+DRAWING_MODULES = ("astunparse", "matplotlib", "networkx")
+
+
+def measure_import_time(module: str) -> Dict[str, int]:
+    """
+    Imports module in a fresh interpreter with -X importtime and returns the cumulative import time
+    in microseconds of every module it imported, with module's own time under its name.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, check=True)
+    # lines look like "import time:       self [us] |  cumulative | imported package"
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def check_import_time(module: str, budget_us: int, forbidden: Iterable[str] = ()) -> int:
+    """Raises BenchmarkRegressionError if importing module takes longer than budget_us or imports forbidden ones."""
+    times = measure_import_time(module)
+    imported = [name for name in forbidden if name in times]
+    if imported:
+        raise BenchmarkRegressionError(f"importing {module} imports {', '.join(imported)}")
+    if times[module] > budget_us:
+        raise BenchmarkRegressionError(f"importing {module} takes {times[module]}us, the budget is {budget_us}us")
+    return times[module]
+
+
+def check_gen_fibs_import() -> NoReturn:
+    import_us = check_import_time(GEN_FIBS_MODULE, GEN_FIBS_IMPORT_BUDGET_US, DRAWING_MODULES)
+    print(f"import {GEN_FIBS_MODULE}: {import_us}us of {GEN_FIBS_IMPORT_BUDGET_US}us budget")
+    # the drawer itself loads its backend only when drawing
+    check_import_time("hw_1.src.fibs_ast_drawer.main", GEN_FIBS_IMPORT_BUDGET_US * 2, DRAWING_MODULES)
+
+
+if __name__ == '__main__':
+    check_gen_fibs_import()
@@ -1,39 +1,86 @@
+import heapq
 import math
 import os
-import sys
-import threading
-import time
 from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
-from typing import Callable, Tuple
-from typing.io import TextIO
+from itertools import repeat
+from typing import Callable, List, Optional, Tuple
 
-from hw_4.src.utils import measure
+from hw_4.src.quadrature import rule_points, weighted_partial_sum, combine_partial_sums, gauss_kronrod
+from hw_4.src.tracing import Tracer
+from hw_4.src.benchmark import BenchmarkResult, benchmark, write_json, write_csv, check_regressions
 
 
-def integrate_task(f: Callable[[float], float], a: float, step: float, iteration: int, start_time: float) \
-        -> Tuple[float, str]:
-    logs = f"Start iteration: {iteration} at {time.time() - start_time:.4f}s" + \
-           f" by thread {threading.get_ident()} of process {os.getpid()}"
-    res = f(a + iteration * step) * step
-    logs += f"\nFinish iteration: {iteration} at {time.time() - start_time:.4f}s"
-    return res, logs
+def integrate_task(f: Callable[[float], float], a: float, step: float, iteration: int) -> float:
+    return f(a + iteration * step) * step
 
 
 def integrate(f: Callable[[float], float], a: float, b: float, get_pool_executor: Callable[[int], Executor],
-              n_jobs: int = 1, n_iter: int = 1000, logs_file: TextIO = sys.stdout, chunk_size: int = 1):
+              n_jobs: int = 1, n_iter: int = 1000, chunk_size: int = 1, tracer: Optional[Tracer] = None) -> float:
+    """
+    Tasks are traced if tracer is given: workers record into their own buffers, which tracer collects
+    once per worker after the map, otherwise the plain integrate_task is mapped.
+    """
     step = (b - a) / n_iter
-    global_start_time = time.time()
+    args = (repeat(f, n_iter), repeat(a, n_iter), repeat(step, n_iter), range(n_iter))
 
     with get_pool_executor(n_jobs) as executor:
-        args = [(f, a, step, i, global_start_time) for i in range(n_iter)]
-        iterations_res = executor.map(integrate_task, *list(zip(*args)), chunksize=chunk_size)
+        if tracer is None:
+            return sum(executor.map(integrate_task, *args, chunksize=chunk_size))
+        iterations_res = list(executor.map(tracer.traced(integrate_task), range(n_iter), *args,
+                                           chunksize=chunk_size))
+        tracer.collect(executor, n_jobs)
+    return sum(iterations_res)
+
+
+def integrate_partitioned(f: Callable[[float], float], a: float, b: float,
+                          get_pool_executor: Callable[[int], Executor], n_jobs: int = 1, n_iter: int = 1000,
+                          rule: str = "left") -> float:
+    """
+    Splits the grid over [a, b] into one contiguous range per worker, each worker returns a single
+    partial sum computed by the batched engine; partial sums are combined with math.fsum.
+    """
+    n_points = rule_points(rule, n_iter)
+    step = (b - a) / n_iter
+    bounds = [n_points * job // n_jobs for job in range(n_jobs + 1)]
+
+    with get_pool_executor(n_jobs) as executor:
+        partial_sums = list(executor.map(weighted_partial_sum, repeat(f), repeat(a), repeat(step), repeat(rule),
+                                         bounds[:-1], bounds[1:]))
 
-    values, logs = zip(*iterations_res)
-    print("\n".join(logs), file=logs_file)
-    return sum(values)
+    return combine_partial_sums(f, a, b, step, rule, partial_sums)
+
+
+def integrate_adaptive(f: Callable[[float], float], a: float, b: float, get_pool_executor: Callable[[int], Executor],
+                       n_jobs: int = 1, abs_tol: float = 1e-9, rel_tol: float = 1e-9, max_intervals: int = 10_000) \
+        -> Tuple[float, float]:
+    """
+    Adaptive Gauss-Kronrod integration: the subintervals with the largest error estimates are taken
+    from a work queue, bisected and estimated by the pool workers, until the total error bound satisfies
+    max(abs_tol, rel_tol * |estimate|) or max_intervals is reached. Returns the estimate and the error bound.
+    """
+    with get_pool_executor(n_jobs) as executor:
+        estimate, error = executor.submit(gauss_kronrod, f, a, b).result()
+        work_queue = [(-error, a, b, estimate)]  # max-heap by interval error
 
+        while error > max(abs_tol, rel_tol * abs(estimate)) and len(work_queue) < max_intervals:
+            worst = [heapq.heappop(work_queue) for _ in range(min(n_jobs, len(work_queue)))]
+            lefts, rights = [], []
+            for _, left, right, _ in worst:
+                middle = (left + right) / 2
+                lefts += [left, middle]
+                rights += [middle, right]
 
-def measure_pools(n_jobs: int, logs_dir: str) -> str:
+            results = executor.map(gauss_kronrod, repeat(f), lefts, rights)
+            for left, right, (part_estimate, part_error) in zip(lefts, rights, results):
+                heapq.heappush(work_queue, (-part_error, left, right, part_estimate))
+
+            estimate = math.fsum(part_estimate for _, _, _, part_estimate in work_queue)
+            error = math.fsum(-neg_part_error for neg_part_error, _, _, _ in work_queue)
+
+    return estimate, error
+
+
+def measure_pools(n_jobs: int, logs_dir: str, warmup: int = 1, repeat: int = 5) -> List[BenchmarkResult]:
     pools_info = [
         (lambda max_workers: ThreadPoolExecutor(max_workers=n_jobs), 1,
          f"thread pool with {n_jobs} workers",
@@ -51,15 +98,27 @@ def measure_pools(n_jobs: int, logs_dir: str) -> str:
 
     pools_results = []
     for pool, chunk_size, description, log_filename in pools_info:
-        with open(logs_dir + log_filename, "w") as logs_file:
-            print(description, file=logs_file)
-            pools_results.append(
-                measure(lambda: integrate(math.cos, 0, math.pi / 2, pool, n_jobs=n_jobs, logs_file=logs_file,
-                                          chunk_size=chunk_size),
-                        description))
-            print("\n", file=logs_file)
+        pools_results.append(
+            benchmark(lambda: integrate(math.cos, 0, math.pi / 2, pool, n_jobs=n_jobs, chunk_size=chunk_size),
+                      description, warmup=warmup, repeat=repeat))
+
+        # trace a separate run, so that tracing does not affect measurements
+        tracer = Tracer()
+        integrate(math.cos, 0, math.pi / 2, pool, n_jobs=n_jobs, chunk_size=chunk_size, tracer=tracer)
+        with open(logs_dir + log_filename + ".json", "w") as trace_file:
+            tracer.write_chrome_trace(trace_file, name="integrate_task", metadata={"description": description})
+
+    partitioned_pools_info = [
+        (lambda max_workers: ThreadPoolExecutor(max_workers=n_jobs), f"thread pool with {n_jobs} workers"),
+        (lambda max_workers: ProcessPoolExecutor(max_workers=n_jobs), f"process pool with {n_jobs} workers")
+    ]
+    for pool, description in partitioned_pools_info:
+        description += " range-partitioned"
+        pools_results.append(
+            benchmark(lambda: integrate_partitioned(math.cos, 0, math.pi / 2, pool, n_jobs=n_jobs), description,
+                      warmup=warmup, repeat=repeat))
 
-    return "\n".join(pools_results)
+    return pools_results
 
 
 if __name__ == '__main__':
@@ -69,8 +128,17 @@ if __name__ == '__main__':
     logs_directory = output_directory + "logs/"
     os.makedirs(os.path.dirname(logs_directory), exist_ok=True)
 
-    measurements = "\n\n".join([measure_pools(n_jobs, logs_directory) for n_jobs in range(1, os.cpu_count() * 2 + 1)])
+    measurements = [measure_pools(n_jobs, logs_directory) for n_jobs in range(1, os.cpu_count() * 2 + 1)]
+    results = [result for pools_results in measurements for result in pools_results]
 
     measurements_filename = output_directory + "measurements.txt"
     with open(measurements_filename, "w") as file:
-        file.write(measurements)
+        file.write("\n\n".join("\n".join(map(str, pools_results)) for pools_results in measurements))
+    with open(output_directory + "measurements.json", "w") as file:
+        write_json(results, file)
+    with open(output_directory + "measurements.csv", "w", newline="") as file:
+        write_csv(results, file)
+
+    baseline_filename = output_directory + "measurements-baseline.json"
+    if os.path.exists(baseline_filename):
+        check_regressions(results, baseline_filename)
@@ -0,0 +1,242 @@
+import time
+import traceback
+from itertools import count
+from multiprocessing import Event, Lock, Process, Semaphore, SimpleQueue, Value
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, NoReturn, Optional, Sequence, Tuple, \
+    Union
+
+from hw_4.src.ring_buffer import ORDERED_STORES, RingBuffer
+
+# marks the end of the stream, every worker of a stage gets one
+STOP = None
+
+# items travel between stages as (sequence number, item)
+Message = Tuple[int, Any]
+
+
+class PipelineError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by processes: tokens are added at rate per second up to capacity,
+    which is the largest allowed burst, and every handled item takes one.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = Lock()
+        self._tokens = Value("d", capacity, lock=False)
+        self._updated = Value("d", time.monotonic(), lock=False)
+
+    def acquire(self, cancelled: Event) -> bool:
+        """Waits for a token, returns False if cancelled meanwhile."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens = min(self.capacity, self._tokens.value + (now - self._updated.value) * self.rate)
+                self._updated.value = now
+                if tokens >= 1:
+                    self._tokens.value = tokens - 1
+                    return True
+                self._tokens.value = tokens
+                wait_secs = (1 - tokens) / self.rate
+            if cancelled.wait(wait_secs):
+                return False
+
+
+class ReorderBuffer:
+    """Holds messages which came ahead of their turn and releases them in sequence number order."""
+
+    def __init__(self):
+        self.next_seq = 0
+        self.pending: Dict[int, Any] = {}
+
+    def push(self, message: Message) -> List[Message]:
+        seq, item = message
+        self.pending[seq] = item
+        ready = []
+        while self.next_seq in self.pending:
+            ready.append((self.next_seq, self.pending.pop(self.next_seq)))
+            self.next_seq += 1
+        return ready
+
+
+class QueueChannel:
+    """
+    Bounded multiprocessing queue with the batch interface of RingBuffer, any number of processes may use it.
+    put_many sends lists of up to batch_size messages as single queue items, small enough not to leave
+    other workers idle; STOP always goes alone, as it belongs to one worker.
+    SimpleQueue writes to its pipe in put itself, unlike Queue with a feeder thread, so STOP sent by the last
+    worker of a stage can't overtake results which other workers have already put.
+    """
+
+    def __init__(self, maxsize: int, batch_size: int = 64):
+        self.batch_size = batch_size
+        self._queue = SimpleQueue()
+        self._free_slots = Semaphore(maxsize)
+
+    def _put(self, item) -> NoReturn:
+        self._free_slots.acquire()
+        self._queue.put(item)
+
+    def put(self, message: Message) -> NoReturn:
+        self._put(STOP if message is STOP else [message])
+
+    def put_many(self, messages: Iterable[Message]) -> NoReturn:
+        batch = []
+        for message in messages:
+            if message is STOP:
+                if batch:
+                    self._put(batch)
+                    batch = []
+                self._put(STOP)
+                continue
+            batch.append(message)
+            if len(batch) == self.batch_size:
+                self._put(batch)
+                batch = []
+        if batch:
+            self._put(batch)
+
+    def get_many(self) -> List[Message]:
+        batch = self._queue.get()
+        self._free_slots.release()
+        return [STOP] if batch is STOP else batch
+
+    def close(self) -> NoReturn:
+        self._queue.close()
+
+
+Channel = Union[QueueChannel, RingBuffer]
+
+
+class Stage(NamedTuple):
+    func: Callable[[Any], Any]
+    workers: int = 1
+    rate_limiter: Optional[TokenBucket] = None  # shared by the stage workers
+
+
+def stage_worker(stage: Stage, in_channel: Channel, out_channel: Channel, running_workers: Value, next_workers: int,
+                 cancelled: Event, errors: SimpleQueue, ordered: bool) -> NoReturn:
+    """
+    Handles messages until STOP, blocking on the channel itself. Messages are taken and their results sent
+    in batches, except for rate limited stages, whose results go out one by one not to wait for the next tokens.
+    The last worker of the stage to stop passes STOP on to every worker of the next stage.
+    Messages are dropped after cancellation. A single worker of an ordered pipeline handles messages in input order.
+    A failure is reported to errors and cancels the pipeline, the worker then drains its input until STOP
+    as usual, so neither its producers block on a full channel nor the consumer waits for STOP forever.
+    """
+    reorder = ReorderBuffer() if ordered and stage.workers == 1 else None
+    stopped = False
+    while not stopped:
+        results = []
+        messages = in_channel.get_many()
+        try:
+            for message in messages:
+                if message is STOP:
+                    stopped = True
+                    break
+                if cancelled.is_set():
+                    continue
+                for seq, item in reorder.push(message) if reorder is not None else (message,):
+                    if stage.rate_limiter is None:
+                        results.append((seq, stage.func(item)))
+                    elif stage.rate_limiter.acquire(cancelled):
+                        out_channel.put((seq, stage.func(item)))
+            out_channel.put_many(results)
+        except Exception:
+            errors.put(traceback.format_exc())
+            cancelled.set()
+
+    with running_workers.get_lock():
+        running_workers.value -= 1
+        is_last = running_workers.value == 0
+    if is_last:
+        out_channel.put_many([STOP] * next_workers)
+
+
+class Pipeline:
+    """
+    Chain of stages run by worker processes and linked by bounded queues of message batches: put blocks
+    while the first one is full, so a slow stage holds back its producers instead of buffering without limit.
+    Results are read by iterating over the pipeline, which ends after close once everything put is handled;
+    they must be read before join, as workers can't exit with items left in their queues.
+    Items are numbered on put, and an ordered pipeline yields results in input order
+    even when stages are handled by several workers.
+    With ring_capacity, links between single processes are shared memory rings of that many bytes
+    instead of queues, which then carry str items only; on CPUs which may reorder stores all links are queues.
+    If a stage fails, the pipeline is cancelled and iterating over it raises PipelineError once the stream ends.
+    """
+
+    def __init__(self, stages: Sequence[Stage], buffer_size: int = 1024, ordered: bool = True,
+                 ring_capacity: Optional[int] = None):
+        self.stages = list(stages)
+        self.ordered = ordered
+        # the pipeline user puts and gets items from one thread each
+        link_ends = [1] + [stage.workers for stage in self.stages] + [1]
+        self.channels: List[Channel] = [
+            RingBuffer(ring_capacity) if ring_capacity and ORDERED_STORES and producers == consumers == 1
+            else QueueChannel(buffer_size)
+            for producers, consumers in zip(link_ends, link_ends[1:])]
+        self.cancelled = Event()
+        self.errors = SimpleQueue()  # tracebacks of failed stage workers
+        self._seq = count()
+        self.processes: List[Process] = []
+        for index, stage in enumerate(self.stages):
+            next_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            running_workers = Value("i", stage.workers)
+            self.processes += [
+                Process(target=stage_worker, args=(stage, self.channels[index], self.channels[index + 1],
+                                                   running_workers, next_workers, self.cancelled, self.errors, ordered))
+                for _ in range(stage.workers)]
+
+    def start(self) -> NoReturn:
+        for process in self.processes:
+            process.start()
+
+    def put(self, item: Any) -> NoReturn:
+        self.channels[0].put((next(self._seq), item))
+
+    def put_many(self, items: Iterable[Any]) -> NoReturn:
+        self.channels[0].put_many([(next(self._seq), item) for item in items])
+
+    def batches(self) -> Iterator[List[Any]]:
+        """Results in batches as they arrive, which saves consumers a wakeup per item."""
+        reorder = ReorderBuffer() if self.ordered else None
+        while True:
+            batch = []
+            for message in self.channels[-1].get_many():
+                if message is STOP:
+                    if batch:
+                        yield batch
+                    if not self.errors.empty():
+                        raise PipelineError(f"stage worker failed:\n{self.errors.get()}")
+                    return
+                batch += [item for _, item in (reorder.push(message) if reorder is not None else (message,))]
+            if batch:
+                yield batch
+
+    def __iter__(self) -> Iterator[Any]:
+        for batch in self.batches():
+            yield from batch
+
+    def close(self) -> NoReturn:
+        """No more items will be put: the stages finish what is queued and stop."""
+        self.channels[0].put_many([STOP] * self.stages[0].workers)
+
+    def cancel(self) -> NoReturn:
+        """Like close, but queued items are dropped and rate limiter waits are interrupted."""
+        self.cancelled.set()
+        self.close()
+
+    def join(self) -> NoReturn:
+        for process in self.processes:
+            process.join()
+        for channel in self.channels:
+            channel.close()
+        self.errors.close()
@@ -0,0 +1,11 @@
+from multiprocessing import resource_tracker
+from typing import NoReturn
+
+
+def share_resource_tracker() -> NoReturn:
+    """
+    Starts the resource tracker of this process unless it is running already. Must be called before forking
+    workers which attach to shared memory segments: forked workers then share the tracker of their parent,
+    otherwise each of them starts its own, which unlinks the segments the worker attached to when it exits.
+    """
+    resource_tracker.ensure_running()
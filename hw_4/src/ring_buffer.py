@@ -0,0 +1,263 @@
+import os
+import platform
+import struct
+from collections import deque
+from multiprocessing import Event
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Deque, Iterable, List, NoReturn, Optional, Tuple
+
+from hw_4.src.resource_tracking import share_resource_tracker
+
+# items are sent as (sequence number, str), None marks the end of the stream
+Message = Optional[Tuple[int, str]]
+
+COUNTER = struct.Struct("<Q")
+RECORD_HEADER = struct.Struct("<Iq")  # UTF-8 payload length, sequence number
+STOP_LENGTH = 0xFFFFFFFF
+MORE_FLAG = 0x80000000  # set in the length of every fragment of a payload but the last one
+MIN_CAPACITY = 64
+
+# head is written by the producer only and tail by the consumer only, so they live on separate cache lines
+HEAD_OFFSET = 0
+TAIL_OFFSET = 64
+CONSUMER_WAITING_OFFSET = 128
+PRODUCER_WAITING_OFFSET = 136
+DATA_OFFSET = 192
+
+# spinning only helps when the other side runs on another CPU meanwhile
+SPIN_CHECKS = 200 if os.cpu_count() > 1 else 0
+# waits are rechecked at least this often, which bounds the delay of a wakeup missed by the flag check
+WAIT_TIMEOUT_SECS = 0.001
+
+# counters are published by plain stores without memory barriers, which is only safe where the CPU
+# doesn't reorder stores with each other or loads with each other: x86 does not, ARM and POWER may
+# make the new head visible before the records it covers
+ORDERED_STORES = platform.machine().lower() in ("x86_64", "amd64", "i386", "i686", "x86")
+
+
+class RingBufferError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class RingBuffer:
+    """
+    Single-producer single-consumer channel over a ring in shared memory. Records are a header with
+    the payload length and the sequence number followed by the UTF-8 payload.
+    head and tail count bytes ever written and read, the producer publishes head after copying
+    the records and the consumer publishes tail after reading them, so neither side takes a lock.
+    A side which found the ring empty (full) spins shortly, then raises its waiting flag and sleeps
+    on an event, which the other side sets only if the flag is up.
+    put_many and get_many move a whole batch with one publication and at most one wakeup.
+    Payloads longer than a quarter of the ring are split into fragments, so messages of any size go through.
+    Publication relies on the store ordering of x86, see ORDERED_STORES.
+    """
+
+    def __init__(self, capacity: int = 1 << 20):
+        if not MIN_CAPACITY <= capacity < MORE_FLAG:
+            raise RingBufferError(f"ring capacity must be in [{MIN_CAPACITY}, {MORE_FLAG}), got {capacity}")
+        self.capacity = capacity
+        # small enough for the producer to write the next fragment while the consumer reads the previous ones
+        self.max_fragment = capacity // 4 - RECORD_HEADER.size
+        share_resource_tracker()
+        self._segment = SharedMemory(create=True, size=DATA_OFFSET + capacity)
+        self._segment.buf[:DATA_OFFSET] = bytes(DATA_OFFSET)
+        self._owner_pid = os.getpid()
+        self._data_ready = Event()
+        self._space_ready = Event()
+        self._received: Deque[Message] = deque()
+        self._fragments: List[bytes] = []
+
+    def __getstate__(self):
+        return self.capacity, self._segment.name, self._owner_pid, self._data_ready, self._space_ready
+
+    def __setstate__(self, state):
+        self.capacity, name, self._owner_pid, self._data_ready, self._space_ready = state
+        self.max_fragment = self.capacity // 4 - RECORD_HEADER.size
+        self._segment = SharedMemory(name)
+        self._received = deque()
+        self._fragments = []
+
+    def _counter(self, offset: int) -> int:
+        return COUNTER.unpack_from(self._segment.buf, offset)[0]
+
+    def _set_counter(self, offset: int, value: int) -> NoReturn:
+        COUNTER.pack_into(self._segment.buf, offset, value)
+
+    def _wait(self, ready: Callable[[], bool], flag_offset: int, event: Event) -> NoReturn:
+        for _ in range(SPIN_CHECKS):
+            if ready():
+                return
+        while not ready():
+            event.clear()
+            self._set_counter(flag_offset, 1)
+            if not ready():
+                event.wait(WAIT_TIMEOUT_SECS)
+            self._set_counter(flag_offset, 0)
+
+    def _wake(self, flag_offset: int, event: Event) -> NoReturn:
+        if self._counter(flag_offset):
+            event.set()
+
+    def _write(self, position: int, data: bytes) -> NoReturn:
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        buf = self._segment.buf
+        buf[DATA_OFFSET + start:DATA_OFFSET + start + first] = data[:first]
+        buf[DATA_OFFSET:DATA_OFFSET + len(data) - first] = data[first:]
+
+    def _read(self, position: int, size: int) -> bytes:
+        start = position % self.capacity
+        first = min(size, self.capacity - start)
+        buf = self._segment.buf
+        return bytes(buf[DATA_OFFSET + start:DATA_OFFSET + start + first]) + \
+            bytes(buf[DATA_OFFSET:DATA_OFFSET + size - first])
+
+    def _encode(self, messages: Iterable[Message]) -> List[bytes]:
+        records = []
+        for message in messages:
+            if message is None:
+                records.append(RECORD_HEADER.pack(STOP_LENGTH, 0))
+                continue
+            seq, item = message
+            payload = item.encode()
+            if len(payload) <= self.max_fragment:
+                records.append(RECORD_HEADER.pack(len(payload), seq) + payload)
+                continue
+            for start in range(0, len(payload), self.max_fragment):
+                fragment = payload[start:start + self.max_fragment]
+                more = MORE_FLAG if start + self.max_fragment < len(payload) else 0
+                records.append(RECORD_HEADER.pack(len(fragment) | more, seq) + fragment)
+        return records
+
+    def put(self, message: Message) -> NoReturn:
+        self.put_many((message,))
+
+    def put_many(self, messages: Iterable[Message]) -> NoReturn:
+        records = self._encode(messages)
+        head = self._counter(HEAD_OFFSET)
+        start = 0
+        while start < len(records):
+            free = self.capacity - (head - self._counter(TAIL_OFFSET))
+            stop, size = start, 0
+            while stop < len(records) and size + len(records[stop]) <= free:
+                size += len(records[stop])
+                stop += 1
+            if stop == start:
+                needed = len(records[start])
+                self._wait(lambda: self.capacity - (head - self._counter(TAIL_OFFSET)) >= needed,
+                           PRODUCER_WAITING_OFFSET, self._space_ready)
+                continue
+            self._write(head, b"".join(records[start:stop]))
+            head += size
+            self._set_counter(HEAD_OFFSET, head)
+            self._wake(CONSUMER_WAITING_OFFSET, self._data_ready)
+            start = stop
+
+    def get(self) -> Message:
+        if not self._received:
+            self._received.extend(self.get_many())
+        return self._received.popleft()
+
+    def get_many(self) -> List[Message]:
+        """Waits for messages and returns all available ones up to the end of the stream."""
+        if self._received:
+            messages = list(self._received)
+            self._received.clear()
+            return messages
+
+        messages = []
+        while not messages:  # only fragments of a message may have arrived so far
+            tail = self._counter(TAIL_OFFSET)
+            self._wait(lambda: self._counter(HEAD_OFFSET) != tail, CONSUMER_WAITING_OFFSET, self._data_ready)
+            data = self._read(tail, self._counter(HEAD_OFFSET) - tail)
+
+            offset = 0
+            while offset < len(data):
+                length, seq = RECORD_HEADER.unpack_from(data, offset)
+                offset += RECORD_HEADER.size
+                if length == STOP_LENGTH:
+                    messages.append(None)
+                    break
+                if length < MORE_FLAG and not self._fragments:
+                    messages.append((seq, data[offset:offset + length].decode()))
+                    offset += length
+                    continue
+                end = offset + (length & ~MORE_FLAG)
+                self._fragments.append(data[offset:end])
+                offset = end
+                if length < MORE_FLAG:
+                    messages.append((seq, b"".join(self._fragments).decode()))
+                    self._fragments.clear()
+            self._set_counter(TAIL_OFFSET, tail + offset)
+            self._wake(PRODUCER_WAITING_OFFSET, self._space_ready)
+        return messages
+
+    def close(self) -> NoReturn:
+        """Detaches from the ring, which is also removed when called by the process which created it."""
+        self._segment.close()
+        if os.getpid() == self._owner_pid:
+            self._segment.unlink()
+
+
+def pipe_condition_producer(conn, condition, n_messages: int) -> NoReturn:
+    """The transport hard_processes used before: a send and a notify per message."""
+    for i in range(n_messages):
+        conn.send(f"message {i}")
+        condition.acquire()
+        condition.notify()
+        condition.release()
+
+
+def pipe_condition_consumer(conn, condition, n_messages: int) -> NoReturn:
+    for _ in range(n_messages):
+        condition.acquire()
+        condition.wait_for(conn.poll)
+        condition.release()
+        conn.recv()
+
+
+def ring_producer(ring: RingBuffer, n_messages: int, batch_size: int) -> NoReturn:
+    for start in range(0, n_messages, batch_size):
+        ring.put_many([(i, f"message {i}") for i in range(start, min(start + batch_size, n_messages))])
+
+
+def ring_consumer(ring: RingBuffer, n_messages: int) -> NoReturn:
+    received = 0
+    while received < n_messages:
+        received += len(ring.get_many())
+
+
+def measure_transports(n_messages: int, repeat: int = 3) -> List[str]:
+    from multiprocessing import Condition, Pipe, Process
+    from hw_4.src.benchmark import benchmark
+
+    def run_pipe_condition():
+        consumer_conn, producer_conn = Pipe(duplex=False)
+        condition = Condition()
+        producer = Process(target=pipe_condition_producer, args=(producer_conn, condition, n_messages))
+        producer.start()
+        pipe_condition_consumer(consumer_conn, condition, n_messages)
+        producer.join()
+
+    def run_ring(batch_size: int):
+        ring = RingBuffer()
+        producer = Process(target=ring_producer, args=(ring, n_messages, batch_size))
+        producer.start()
+        ring_consumer(ring, n_messages)
+        producer.join()
+        ring.close()
+
+    results = [benchmark(run_pipe_condition, "Pipe + Condition", repeat=repeat)]
+    for batch_size in (1, 64, 1024):
+        results.append(benchmark(lambda: run_ring(batch_size), f"shared memory ring, batches of {batch_size}",
+                                 repeat=repeat))
+    return [f"{result.name}: {n_messages / result.median_s:,.0f} messages/s ({result})" for result in results]
+
+
+if __name__ == '__main__':
+    output_directory = "../artifacts/hard/"
+    os.makedirs(os.path.dirname(output_directory), exist_ok=True)
+    with open(output_directory + "transports.txt", "w") as file:
+        file.write("\n".join(measure_transports(100_000)))
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from array import array
+from concurrent.futures import Executor
+from itertools import repeat
+from multiprocessing import Manager
+from typing import Callable, Dict, List, Optional, Tuple, TextIO
+
+# (task id, process id, thread id, start_ns, end_ns)
+TraceEvent = Tuple[int, int, int, int, int]
+Worker = Tuple[int, int]
+
+
+class TraceBuffer:
+    """Fixed-size columns of one worker's events, events past capacity are counted as dropped."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.task_ids = array("q", bytes(8 * capacity))
+        self.starts_ns = array("q", bytes(8 * capacity))
+        self.ends_ns = array("q", bytes(8 * capacity))
+        self.size = 0
+        self.dropped = 0
+
+    def __getstate__(self):
+        # only recorded events are sent back from worker processes
+        return dict(self.__dict__, capacity=self.size, task_ids=self.task_ids[:self.size],
+                    starts_ns=self.starts_ns[:self.size], ends_ns=self.ends_ns[:self.size])
+
+    def record(self, task_id: int, start_ns: int, end_ns: int):
+        if self.size == self.capacity:
+            self.dropped += 1
+            return
+        self.task_ids[self.size] = task_id
+        self.starts_ns[self.size] = start_ns
+        self.ends_ns[self.size] = end_ns
+        self.size += 1
+
+
+# buffer of the current pool worker, a thread of a thread pool or the process of a process pool
+_worker_local = threading.local()
+
+
+def worker_buffer(capacity: int) -> TraceBuffer:
+    buffer = getattr(_worker_local, "buffer", None)
+    if buffer is None:
+        buffer = _worker_local.buffer = TraceBuffer(capacity)
+    return buffer
+
+
+class TracedCall:
+    """
+    Picklable wrapper for func(*args), task id goes first: its trace event is recorded into the buffer
+    of the worker which runs it, so only the result goes back with every task.
+    """
+
+    def __init__(self, func: Callable, capacity_per_worker: int):
+        self.func = func
+        self.capacity_per_worker = capacity_per_worker
+
+    def __call__(self, task_id: int, *args):
+        start_ns = time.perf_counter_ns()
+        result = self.func(*args)
+        end_ns = time.perf_counter_ns()
+        worker_buffer(self.capacity_per_worker).record(task_id, start_ns, end_ns)
+        return result
+
+
+def take_worker_buffer(barrier) -> Tuple[Worker, Optional[TraceBuffer]]:
+    """
+    Detaches the calling worker's buffer. Waits for all workers of the pool to get here,
+    so no worker takes two of these tasks and every worker gives its buffer away exactly once.
+    """
+    buffer = getattr(_worker_local, "buffer", None)
+    _worker_local.buffer = None
+    barrier.wait()
+    return (os.getpid(), threading.get_ident()), buffer
+
+
+class Tracer:
+    def __init__(self, capacity_per_worker: int = 1 << 16):
+        self.capacity_per_worker = capacity_per_worker
+        self.buffers: Dict[Worker, TraceBuffer] = {}
+
+    def traced(self, func: Callable) -> TracedCall:
+        return TracedCall(func, self.capacity_per_worker)
+
+    def collect(self, executor: Executor, n_workers: int):
+        """Takes the buffers of all n_workers workers of executor once its traced tasks are done."""
+        with Manager() as manager:
+            barrier = manager.Barrier(n_workers)
+            for worker, buffer in executor.map(take_worker_buffer, repeat(barrier, n_workers)):
+                if buffer is not None:
+                    self.buffers[worker] = buffer
+
+    @property
+    def dropped(self) -> int:
+        return sum(buffer.dropped for buffer in self.buffers.values())
+
+    def events(self) -> List[TraceEvent]:
+        """Merges events of all workers ordered by start time."""
+        merged = []
+        for (pid, tid), buffer in self.buffers.items():
+            merged += zip(buffer.task_ids[:buffer.size], [pid] * buffer.size, [tid] * buffer.size,
+                          buffer.starts_ns[:buffer.size], buffer.ends_ns[:buffer.size])
+        merged.sort(key=lambda event: event[3])
+        return merged
+
+    def write_chrome_trace(self, file: TextIO, name: str = "task", metadata: Optional[dict] = None):
+        """Writes complete ("X") events in Chrome trace-event JSON, timestamps relative to the first event."""
+        events = self.events()
+        origin_ns = events[0][3] if events else 0
+        trace_events = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                         "ts": (start_ns - origin_ns) / 1000, "dur": (end_ns - start_ns) / 1000,
+                         "args": {"task": task_id}}
+                        for task_id, pid, tid, start_ns, end_ns in events]
+        trace = {"traceEvents": trace_events, "displayTimeUnit": "ns",
+                 "otherData": dict(metadata or {}, dropped=self.dropped)}
+        json.dump(trace, file)
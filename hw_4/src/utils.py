@@ -1,9 +1,7 @@
-import time
 from typing import Callable, NoReturn
 
+from hw_4.src.benchmark import benchmark
 
-def measure(callable_task: Callable[[], NoReturn], measure_name: str) -> str:
-    start = time.time()
-    callable_task()
-    end = time.time()
-    return f"{measure_name}: {end - start:.4f}s"
+
+def measure(callable_task: Callable[[], NoReturn], measure_name: str, warmup: int = 0, repeat: int = 1) -> str:
+    return str(benchmark(callable_task, measure_name, warmup=warmup, repeat=repeat))